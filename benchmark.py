@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+
+import numpy as np
+
+from pymetatrader import MetaTrader
+from pymetatrader.simulator import SYMBOLS, MTServerSimulator
+
+logger = logging.getLogger("PyMetaTrader:Benchmark")
+
+# lower is better for every result but rates
+RATE_SUFFIX = "_per_second"
+
+
+async def bench_requests(request, count: int, concurrency: int) -> dict:
+    latencies = []
+
+    async def run(n):
+        for _ in range(n):
+            sent = time.perf_counter()
+            await request()
+            latencies.append(time.perf_counter() - sent)
+
+    started = time.perf_counter()
+    share, rest = divmod(count, concurrency)
+    await asyncio.gather(*(run(share + (i < rest)) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array(latencies)
+    return dict(
+        requests_per_second=count / elapsed,
+        p50_ms=float(np.percentile(latencies, 50) * 1000),
+        p99_ms=float(np.percentile(latencies, 99) * 1000),
+    )
+
+
+async def bench_fanout(api: MetaTrader, received: dict, duration: float) -> dict:
+    await api.subscribe_ticks(*SYMBOLS)
+    await api.subscribe_quotes(list(SYMBOLS))
+    for symbol in SYMBOLS:
+        await api.subscribe_bars(symbol, "M1")
+    await asyncio.sleep(0.5)
+
+    received.clear()
+    started = time.perf_counter()
+    await asyncio.sleep(duration)
+    elapsed = time.perf_counter() - started
+    messages = sum(received.values())
+
+    await api._request("UNSUB_ALL")
+    return dict(
+        messages_per_second=messages / elapsed,
+        **{f"{t.lower()}_per_second": n / elapsed for t, n in received.items()},
+    )
+
+
+def bench_parse(api: MetaTrader, binary: bool, count: int) -> dict:
+    # seconds to parse one publication of all symbols, without the network
+    simulator = MTServerSimulator(seed=0)
+    simulator.binary = binary
+    keys = dict(
+        BARS=[(symbol, "M1") for symbol in SYMBOLS], QUOTES=SYMBOLS, TICKS=SYMBOLS
+    )
+
+    result = dict()
+    for type, symbols in keys.items():
+        (message,) = simulator.publications(type, symbols)
+        data = message.split(b" ", 1)[1]
+        if binary:
+            parse = lambda: api._parse_subcribe_binary(type, data)
+        else:
+            parse = lambda: api._parse_subcribe_data(type, data.decode())
+
+        started = time.perf_counter()
+        for _ in range(count):
+            parse()
+        result[f"{type.lower()}_us"] = (time.perf_counter() - started) / count * 1e6
+    return result
+
+
+async def run(args) -> dict:
+    simulator = MTServerSimulator(
+        publish_interval=args.publish_interval,
+        delay=args.delay,
+        seed=0,
+        capacity=args.capacity,
+    )
+    received = dict()
+
+    async def on_subscribe(type, data):
+        received[type] = received.get(type, 0) + 1
+
+    # uncached requests, comparable with earlier baselines
+    api = MetaTrader(cache_ttls={})
+    await api.start(
+        on_subscribe, dealer=args.dealer, broker=args.broker, transport=args.transport
+    )
+    simulator.start()
+    try:
+        await asyncio.wait_for(api.get_time(), 10)
+        if args.binary:
+            await api.negotiate("BINARY")
+
+        now = time.time() * 1000
+        bars_from = now - args.bars * 60 * 1000
+        results = dict(
+            client_time=await bench_requests(
+                lambda: api._client.request(b"TIME"), args.count, args.concurrency
+            ),
+            api_time=await bench_requests(api.get_time, args.count, args.concurrency),
+            api_bars=await bench_requests(
+                lambda: api.get_bars("EURUSD", "M1", bars_from, now, as_array=True),
+                max(1, args.count // 10),
+                args.concurrency,
+            ),
+            fanout=await bench_fanout(api, received, args.duration),
+        )
+    finally:
+        simulator.stop()
+        await api.stop()
+
+    results["parse"] = bench_parse(api, args.binary, args.parse_count)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    # results worse than the baseline by more than `tolerance` (a fraction)
+    regressions = []
+    for group, values in baseline.items():
+        for name, expected in values.items():
+            actual = results.get(group, {}).get(name)
+            if actual is None or not expected:
+                continue
+            if name.endswith(RATE_SUFFIX):
+                change = (expected - actual) / expected
+            else:
+                change = (actual - expected) / expected
+            if change > tolerance:
+                regressions.append(
+                    f"{group}.{name}: {actual:.4g} vs {expected:.4g} "
+                    f"({change:+.0%} worse)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="PyMetaTrader benchmark against a simulated MTServer"
+    )
+    parser.add_argument(
+        "--broker", default="thread", choices=("thread", "async", "process")
+    )
+    parser.add_argument("--transport", default="tcp", choices=("tcp", "inproc", "ipc"))
+    parser.add_argument("--dealer", action="store_true", help="pipelined client")
+    parser.add_argument("--binary", action="store_true", help="negotiate BINARY")
+    parser.add_argument("--count", type=int, default=2000, help="requests per run")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--bars", type=int, default=1000, help="bars per request")
+    parser.add_argument("--duration", type=float, default=3, help="fan-out seconds")
+    parser.add_argument("--publish-interval", type=float, default=0.001)
+    parser.add_argument("--delay", type=float, default=0, help="seconds per request")
+    parser.add_argument(
+        "--capacity", type=int, default=1, help="requests taken at once by the worker"
+    )
+    parser.add_argument("--parse-count", type=int, default=10000)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = asyncio.run(run(args))
+
+    for group, values in results.items():
+        for name, value in values.items():
+            print(f"{group:12} {name:24} {value:12.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
 from .api import *
 from .broker import MT5MQBroker
 from .client import MT5MQClient
+from .models import Deal, Order, Quote, Tick, Trade
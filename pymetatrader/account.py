@@ -0,0 +1,118 @@
+import logging
+from typing import Callable, Mapping
+
+logger = logging.getLogger("PyMetaTrader:Account")
+
+KINDS = ("history_orders", "history_deals", "orders", "trades")
+# kinds of the open state, removed when missing from a snapshot
+OPEN_KINDS = ("orders", "trades")
+
+EVENT_NEW = "new"
+EVENT_CHANGED = "changed"
+EVENT_REMOVED = "removed"
+
+
+class AccountState:
+    # Orders, trades, history orders and history deals by ticket, kept up to
+    # date from REFRESH snapshots and REFRESH_DELTA diffs (DELTA feature).
+    # Listeners are awaited with (kind, event, record) of every new, changed
+    # or removed record only, instead of the whole refresh.
+
+    def __init__(self):
+        self.orders: dict[int, Mapping] = dict()
+        self.trades: dict[int, Mapping] = dict()
+        self.history_orders: dict[int, Mapping] = dict()
+        self.history_deals: dict[int, Mapping] = dict()
+        # sequence of the last applied snapshot or delta, None before the
+        # first snapshot
+        self.seq: int | None = None
+        self._listeners: list[Callable] = []
+
+    def add_listener(self, listener: Callable):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable):
+        self._listeners.remove(listener)
+
+    def order(self, ticket: int) -> Mapping | None:
+        return self.orders.get(ticket)
+
+    def trade(self, ticket: int) -> Mapping | None:
+        return self.trades.get(ticket)
+
+    def deal(self, ticket: int) -> Mapping | None:
+        return self.history_deals.get(ticket)
+
+    async def update(self, type: str, data: dict) -> bool:
+        # -> False when a delta was missed and the state must be reloaded
+        if type == "REFRESH":
+            await self.apply_snapshot(data)
+            return True
+        if type == "REFRESH_DELTA":
+            return await self.apply_delta(data)
+        return True
+
+    async def apply_snapshot(self, data: dict, seq: int = None):
+        for kind in KINDS:
+            records = {record["ticket"]: record for record in data[kind]}
+            current = getattr(self, kind)
+            if kind in OPEN_KINDS:
+                for ticket in [t for t in current if t not in records]:
+                    await self._emit(kind, EVENT_REMOVED, current.pop(ticket))
+            await self._upsert(kind, records.values())
+
+        if seq is not None:
+            self.seq = seq
+
+    async def apply_delta(self, data: dict) -> bool:
+        seq = data["seq"]
+        if self.seq is None:
+            # no snapshot the delta applies to, e.g. right after negotiating
+            # DELTA: the state must be loaded
+            logger.warning("Account delta %s received before a snapshot", seq)
+            return False
+
+        expected = self.seq + 1
+        if seq < expected:
+            if seq != 1:
+                # already part of a reloaded snapshot
+                return True
+            # a restarted terminal numbers its deltas from 1 again
+            expected = 0
+        self.seq = seq
+        for kind in KINDS:
+            await self._upsert(kind, data[kind])
+        for kind in OPEN_KINDS:
+            current = getattr(self, kind)
+            for ticket in data[f"removed_{kind}"]:
+                record = current.pop(ticket, None)
+                if record is not None:
+                    await self._emit(kind, EVENT_REMOVED, record)
+
+        if seq != expected:
+            logger.warning("Account delta %s received, %s expected", seq, expected)
+            return False
+        return True
+
+    def clear(self):
+        for kind in KINDS:
+            getattr(self, kind).clear()
+        self.seq = None
+
+    async def _upsert(self, kind: str, records):
+        current = getattr(self, kind)
+        for record in records:
+            ticket = record["ticket"]
+            previous = current.get(ticket)
+            if previous == record:
+                continue
+            current[ticket] = record
+            event = EVENT_NEW if previous is None else EVENT_CHANGED
+            await self._emit(kind, event, record)
+
+    async def _emit(self, kind: str, event: str, record: Mapping):
+        for listener in self._listeners:
+            try:
+                await listener(kind, event, record)
+            except Exception:
+                logger.exception("Account listener failed for %s %s", kind, record)
@@ -0,0 +1,172 @@
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Iterable
+
+import numpy as np
+
+from .bars import BAR_DTYPE, TIMEFRAMES
+
+logger = logging.getLogger("PyMetaTrader:Aggregator")
+
+# units of the non standard timeframes, e.g. S5, M7, H3, D2
+UNITS = dict(S=1, M=60, H=60 * 60, D=24 * 60 * 60)
+# the terminal opens W1 bars on Sundays and MN1 bars on the first day of the
+# month, 1970-01-04 is the first Sunday since the epoch
+WEEK_OFFSET = 3 * 24 * 60 * 60
+
+
+def bar_period(at: float, timeframe: str | int, seconds: int) -> tuple[float, float]:
+    # -> (start, end) in seconds of the bar of a tick time
+    if timeframe == "W1":
+        start = (at - WEEK_OFFSET) // seconds * seconds + WEEK_OFFSET
+        return start, start + seconds
+    if timeframe == "MN1":
+        day = datetime.fromtimestamp(at, timezone.utc)
+        start = datetime(day.year, day.month, 1, tzinfo=timezone.utc)
+        end = datetime(
+            day.year + day.month // 12, day.month % 12 + 1, 1, tzinfo=timezone.utc
+        )
+        return start.timestamp(), end.timestamp()
+
+    start = at // seconds * seconds
+    return start, start + seconds
+
+
+def aggregate_seconds(timeframe: str | int) -> int:
+    if isinstance(timeframe, int):
+        seconds = timeframe
+    elif timeframe in TIMEFRAMES:
+        seconds = TIMEFRAMES[timeframe]
+    elif timeframe[:1] in UNITS and timeframe[1:].isdigit():
+        seconds = UNITS[timeframe[0]] * int(timeframe[1:])
+    else:
+        raise RuntimeError(f"Unknown timeframe {timeframe}")
+
+    if seconds <= 0:
+        raise RuntimeError(f"Unknown timeframe {timeframe}")
+    return seconds
+
+
+class _Series:
+    __slots__ = ("timeframe", "seconds", "bars", "count", "bar", "end")
+
+    def __init__(self, timeframe: str | int, seconds: int, size: int):
+        self.timeframe = timeframe
+        self.seconds = seconds
+        # ring buffer of closed bars, `count` bars written so far
+        self.bars = np.zeros(size, dtype=BAR_DTYPE)
+        self.count = 0
+        # building bar [time, open, high, low, close, tick_volume, spread,
+        # real_volume] and its end in seconds
+        self.bar: list | None = None
+        self.end = 0.0
+
+    def open(self, at: float, price: float, spread: float):
+        start, self.end = bar_period(at, self.timeframe, self.seconds)
+        self.bar = [start * 1000, price, price, price, price, 1, spread, 0]
+
+    def close(self) -> list:
+        bar = self.bar
+        self.bars[self.count % len(self.bars)] = tuple(bar)
+        self.count += 1
+        self.bar = None
+        return bar
+
+    def closed(self) -> np.ndarray:
+        size = len(self.bars)
+        if self.count <= size:
+            return self.bars[: self.count].copy()
+        head = self.count % size
+        return np.concatenate([self.bars[head:], self.bars[:head]])
+
+
+class BarAggregator:
+    # Builds OHLCV bars of any timeframe (standard, S5, M7, 90 seconds...)
+    # from the TICKS stream: `update` is a subscribe_callback, bars are
+    # built from the bid at the tick time, the tick volume is the number of
+    # ticks. The last `size` closed bars of each symbol/timeframe are kept in
+    # a ring buffer and listeners are awaited with every bar as it closes:
+    # on the first tick of the next bar, or on `close_expired` for symbols
+    # without ticks. Bar times are in milliseconds, like the terminal bars,
+    # and W1/MN1 bars follow calendar weeks and months like them.
+
+    def __init__(self, timeframes: Iterable[str | int], size=1000):
+        self.timeframes = {tf: aggregate_seconds(tf) for tf in timeframes}
+        self.size = size
+        self._series: dict[tuple, _Series] = dict()
+        self._listeners: list[Callable] = []
+
+    def add_listener(self, listener: Callable):
+        # awaited with (symbol, timeframe, bar) of every closed bar
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable):
+        self._listeners.remove(listener)
+
+    async def update(self, type: str, data):
+        if type != "TICKS":
+            return
+
+        if isinstance(data, np.ndarray):
+            ticks = zip(
+                data["symbol"].tolist(),
+                data["at"].tolist(),
+                data["bid"].tolist(),
+                data["spread"].tolist(),
+            )
+        else:
+            ticks = ((t["symbol"], t["at"], t["bid"], t["spread"]) for t in data)
+
+        for symbol, at, price, spread in ticks:
+            for timeframe in self.timeframes:
+                series = self._series.get((symbol, timeframe))
+                if series is None:
+                    seconds = self.timeframes[timeframe]
+                    series = _Series(timeframe, seconds, self.size)
+                    self._series[(symbol, timeframe)] = series
+
+                bar = series.bar
+                if bar is not None and at >= series.end:
+                    await self._emit(symbol, timeframe, series.close())
+                    bar = None
+
+                if bar is None:
+                    series.open(at, price, spread)
+                    continue
+
+                if price > bar[2]:
+                    bar[2] = price
+                elif price < bar[3]:
+                    bar[3] = price
+                bar[4] = price
+                bar[5] += 1
+                bar[6] = spread
+
+    async def close_expired(self, now: float):
+        # close the bars ended before `now`, in the time of the ticks
+        # (trade server seconds)
+        for (symbol, timeframe), series in list(self._series.items()):
+            if series.bar is not None and series.end <= now:
+                await self._emit(symbol, timeframe, series.close())
+
+    def bars(self, symbol: str, timeframe: str | int, building=False) -> np.ndarray:
+        series = self._series.get((symbol, timeframe))
+        if series is None:
+            return np.empty(0, dtype=BAR_DTYPE)
+
+        bars = series.closed()
+        if building and series.bar is not None:
+            bars = np.concatenate([bars, np.array([tuple(series.bar)], BAR_DTYPE)])
+        return bars
+
+    def last(self, symbol: str, timeframe: str | int) -> list | None:
+        # the building bar
+        series = self._series.get((symbol, timeframe))
+        return None if series is None else series.bar
+
+    async def _emit(self, symbol: str, timeframe: str | int, bar: list):
+        for listener in self._listeners:
+            try:
+                await listener(symbol, timeframe, bar)
+            except Exception:
+                logger.exception("Bar listener failed for %s %s", symbol, timeframe)
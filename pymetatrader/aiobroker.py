@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import multiprocessing
+
+import zmq
+import zmq.asyncio
+
+from .broker import PING_INTERVAL, POLICY_LEAST_OUTSTANDING, _bind, _Router
+
+logger = logging.getLogger("PyMetaTrader:MT5MQAsyncBroker")
+
+# Messages handled per socket before yielding back to the event loop
+DRAIN_SIZE = 100
+
+
+class MT5MQAsyncBroker:
+    # Same routing as MT5MQBroker, served by tasks of the running event loop
+    # instead of threads, or by an event loop in a dedicated process. Serving
+    # the client's loop saves the thread handoff but competes with the client
+    # for it: with concurrent requests the thread broker keeps lower latency.
+    _ctx: zmq.Context | None = None
+
+    def __init__(
+        self,
+        policy=POLICY_LEAST_OUTSTANDING,
+        weights: dict[str, int] = None,
+        timeouts: dict[str, float] = None,
+        ctx: zmq.Context | None = None,
+        process=False,
+    ) -> None:
+        self.policy = policy
+        self.weights = weights
+        self.timeouts = timeouts
+        self.process = process
+        self._shared_ctx = ctx
+        self._sockets: list[zmq.Socket] = []
+        self._tasks: list[asyncio.Task] = []
+        self._process: multiprocessing.Process | None = None
+
+    async def start(
+        self,
+        request_client_url="tcp://*:22880",
+        request_worker_url="tcp://*:22990",
+        pubsub_client_url="tcp://*:22881",
+        pubsub_worker_url="tcp://*:22991",
+    ):
+        urls = dict(
+            request_client_url=request_client_url,
+            request_worker_url=request_worker_url,
+            pubsub_client_url=pubsub_client_url,
+            pubsub_worker_url=pubsub_worker_url,
+        )
+        if self.process:
+            self._process = multiprocessing.Process(
+                target=_serve,
+                kwargs=dict(
+                    policy=self.policy,
+                    weights=self.weights,
+                    timeouts=self.timeouts,
+                    urls=urls,
+                ),
+                daemon=True,
+            )
+            self._process.start()
+            logger.info("Broker process started: %s", self._process.pid)
+            return
+
+        if self._shared_ctx is not None:
+            self._ctx = zmq.Context.shadow(self._shared_ctx.underlying)
+        else:
+            self._ctx = zmq.Context()
+
+        self._tasks = [
+            asyncio.ensure_future(
+                self._loop_request(
+                    client_url=request_client_url, worker_url=request_worker_url
+                )
+            ),
+            asyncio.ensure_future(
+                self._loop_xpub_xsub(
+                    client_url=pubsub_client_url, worker_url=pubsub_worker_url
+                )
+            ),
+        ]
+
+    async def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            await asyncio.get_running_loop().run_in_executor(None, self._process.join)
+            self._process = None
+            return
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        for socket in self._sockets:
+            socket.close(linger=0)
+        self._sockets = []
+
+        if self._ctx is not None and self._shared_ctx is None:
+            self._ctx.term()
+        self._ctx = None
+
+    async def serve_forever(self, **urls):
+        await self.start(**urls)
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop()
+
+    def _bind(self, type: int, url: str, identity: bytes = None) -> zmq.Socket:
+        socket = _bind(self._ctx, type, url, identity=identity)
+        self._sockets.append(socket)
+        return socket
+
+    # REQ/RES
+    async def _loop_request(self, client_url: str, worker_url: str):
+        client_socket = self._bind(zmq.ROUTER, client_url, identity=b"CBroker")
+        logger.info("REQ listening for client on %s", client_url)
+
+        worker_socket = self._bind(zmq.ROUTER, worker_url, identity=b"WBroker")
+        logger.info("REQ listening for worker on %s", worker_url)
+
+        router = _Router(
+            client_socket=client_socket,
+            worker_socket=worker_socket,
+            policy=self.policy,
+            weights=self.weights,
+            timeouts=self.timeouts,
+        )
+
+        # the router sends on the sockets directly, ROUTER sends never block
+        await _serve_sockets(
+            [(worker_socket, router.on_worker), (client_socket, router.on_client)],
+            interval=PING_INTERVAL,
+            after=router.maintain,
+        )
+
+    # XPUB/XSUB
+    async def _loop_xpub_xsub(self, client_url: str, worker_url: str):
+        client_socket = self._bind(zmq.XPUB, client_url)
+        logger.info("XPUB-XSUB listening for client on %s", client_url)
+
+        worker_socket = self._ctx.socket(zmq.XSUB)
+        worker_socket.bind(worker_url)
+        self._sockets.append(worker_socket)
+        logger.info("XPUB-XSUB listening for worker on %s", worker_url)
+
+        await _serve_sockets(
+            [
+                # publications to subscribers
+                (worker_socket, client_socket.send_multipart),
+                # subscriptions to publishers
+                (client_socket, worker_socket.send_multipart),
+            ]
+        )
+
+
+async def _serve_sockets(handlers: list, interval: float = None, after=None):
+    # Handles the messages of each (socket, handler) from reader callbacks of
+    # the event loop: no poller future nor task wakeup per message. ZMQ file
+    # descriptors are edge-triggered and a send may consume the edge of a
+    # receive, so the sockets are drained until ZMQ_EVENTS reports no input.
+    loop = asyncio.get_running_loop()
+    fds = [socket.getsockopt(zmq.FD) for socket, _ in handlers]
+    scheduled = False
+
+    def pump():
+        nonlocal scheduled
+        scheduled = False
+        try:
+            for socket, handle in handlers:
+                for msg in _drain(socket):
+                    handle(msg)
+            if after is not None:
+                after()
+        except Exception:
+            logger.exception("Failed to route messages")
+        if not scheduled and any(
+            socket.getsockopt(zmq.EVENTS) & zmq.POLLIN for socket, _ in handlers
+        ):
+            # more than DRAIN_SIZE messages, let other tasks run first
+            scheduled = True
+            loop.call_soon(pump)
+
+    try:
+        for fd in fds:
+            loop.add_reader(fd, pump)
+    except NotImplementedError:
+        # e.g. the proactor loop on Windows
+        await _poll_sockets(handlers, interval, after)
+        return
+
+    try:
+        pump()
+        while True:
+            await asyncio.sleep(interval if interval is not None else 3600)
+            if after is not None:
+                after()
+    finally:
+        for fd in fds:
+            loop.remove_reader(fd)
+
+
+async def _poll_sockets(handlers: list, interval: float = None, after=None):
+    poller = zmq.asyncio.Poller()
+    for socket, _ in handlers:
+        poller.register(zmq.asyncio.Socket.from_socket(socket), zmq.POLLIN)
+
+    while True:
+        await poller.poll(interval * 1000 if interval is not None else None)
+        for socket, handle in handlers:
+            for msg in _drain(socket):
+                handle(msg)
+        if after is not None:
+            after()
+
+
+def _drain(socket: zmq.Socket):
+    for _ in range(DRAIN_SIZE):
+        try:
+            yield socket.recv_multipart(zmq.NOBLOCK)
+        except zmq.Again:
+            return
+
+
+def _serve(policy, weights, timeouts, urls: dict):
+    broker = MT5MQAsyncBroker(policy=policy, weights=weights, timeouts=timeouts)
+    try:
+        asyncio.run(broker.serve_forever(**urls))
+    except KeyboardInterrupt:
+        pass
@@ -1,48 +1,242 @@
 import asyncio
+import functools
 import logging
-from typing import Callable
-
-from .broker import MT5MQBroker
+import time
+from collections import deque
+from typing import AsyncIterator, Callable
+
+import numpy as np
+import zmq
+
+from .account import AccountState
+from .aiobroker import MT5MQAsyncBroker
+from .bars import parse_bars_array, split_range
+from .broker import (
+    POLICY_LEAST_OUTSTANDING,
+    PRIORITY_TIMEOUTS,
+    REPLY_TIMEOUT,
+    MT5MQBroker,
+    classify,
+    transport_urls,
+)
+from .cache import LastValueCache, ResponseCache
 from .client import MT5MQClient
+from .decoders import RecordDecoder
+from .dispatcher import POLICY_BLOCK, POLICY_CONFLATE
+from .metrics import MESSAGE_AGE_SECONDS, PARSE_SECONDS, SUBSCRIPTION_RESYNCS
+from .models import Deal, Order, Quote, Tick, Trade
+from .protocol import (
+    BINARY_SUFFIX,
+    decode_bar_updates,
+    decode_bars,
+    decode_quotes,
+    decode_ticks,
+    split_sequence,
+)
+from .recorder import TickRecorder
+from .sequence import SequenceTracker
+from .store import BarStore
 
 logger = logging.getLogger("PyMetaTrader")
 
+# seconds a response is reused, 0 only shares concurrent identical requests
+CACHE_TTLS = dict(MARKETS=60, ACCOUNT=1, FUND=0, TIME=0, QUOTES=0)
+# cached responses outdated by trade operations and REFRESH publications
+ACCOUNT_COMMANDS = ("ACCOUNT", "FUND", "ORDERS", "TRADES", "DEALS")
+TRADE_COMMANDS = (
+    "OPEN_ORDER",
+    "MODIFY_ORDER",
+    "CANCEL_ORDER",
+    "MODIFY_TRADE",
+    "CLOSE_TRADE",
+    "BATCH",
+)
+# attempts of a failed backfill chunk, and seconds between them times the attempt
+CHUNK_ATTEMPTS = 3
+CHUNK_RETRY_DELAY = 0.5
+
 
 class MetaTrader:
-    _broker: MT5MQBroker | None = None
+    _broker: MT5MQBroker | MT5MQAsyncBroker | None = None
     _client: MT5MQClient | None = None
-
-    def __init__(self):
+    _ctx: zmq.Context | None = None
+    _timeouts: dict[str, float] = PRIORITY_TIMEOUTS
+
+    def __init__(
+        self,
+        bar_store: BarStore | None = None,
+        records=False,
+        account: str | int | None = None,
+        recorder: TickRecorder | None = None,
+        cache_ttls: dict[str, float] | None = None,
+    ):
         self.markets = dict()
-
-    async def start(self, subscribe_callback: Callable):
+        self.features = set()
+        self._bar_store = bar_store
+        self._records = records
+        # TICKS/QUOTES publications are also written to the recorder
+        self._recorder = recorder
+        # route requests to the terminals logged in this account only
+        self.account = account
+        # trade server time minus local time, see sync_clock
+        self.server_offset: float | None = None
+        self.quote_cache = LastValueCache()
+        self.tick_cache = LastValueCache()
+        self.account_state = AccountState()
+        # SEQ numbers of the received publications, by topic
+        self.sequences = SequenceTracker()
+        # subscribed bars: (symbol, timeframe) -> time of the last published
+        # bar, where missed bars are re-fetched from
+        self._bar_subscriptions: dict[tuple, float | None] = dict()
+        self.response_cache = ResponseCache(
+            CACHE_TTLS if cache_ttls is None else cache_ttls
+        )
+
+    async def start(
+        self,
+        subscribe_callback: Callable,
+        topics: list[str] = None,
+        policy: str = POLICY_BLOCK,
+        policies: dict[str, str] = None,
+        dealer=False,
+        routing: str = POLICY_LEAST_OUTSTANDING,
+        priority_weights: dict[str, int] = None,
+        priority_timeouts: dict[str, float] = None,
+        broker="thread",
+        transport="tcp",
+    ):
         if self._broker is not None:
             return
 
-        self._broker = MT5MQBroker()
-        self._client = MT5MQClient()
+        # tcp, or inproc/ipc between the client and a broker of this process
+        broker_urls, client_urls = transport_urls(transport)
+        ctx = None
+        if transport == "inproc":
+            if broker == "process":
+                raise RuntimeError("inproc transport needs an in-process broker")
+            ctx = zmq.Context()
+
+        # requests are awaited as long as the broker may queue them
+        self._timeouts = {**PRIORITY_TIMEOUTS, **(priority_timeouts or dict())}
+
+        # broker threads, tasks of this event loop or a dedicated process. The
+        # async broker shares the loop with the client: on par with threads
+        # for single requests, about half their throughput under concurrency
+        options = dict(
+            policy=routing, weights=priority_weights, timeouts=priority_timeouts
+        )
+        if broker == "thread":
+            self._broker = MT5MQBroker(**options, ctx=ctx)
+            loop = asyncio.get_event_loop()
+            loop.run_in_executor(
+                None, functools.partial(self._broker.start, **broker_urls)
+            )
+        elif broker in ("async", "process"):
+            self._broker = MT5MQAsyncBroker(
+                **options, ctx=ctx, process=broker == "process"
+            )
+            await self._broker.start(**broker_urls)
+        else:
+            raise RuntimeError(f"Unknown broker mode: {broker}")
 
-        loop = asyncio.get_event_loop()
-        loop.run_in_executor(None, func=self._broker.start)
+        self._ctx = ctx
+        self._client = MT5MQClient(ctx=ctx)
 
         # parsing
         async def subcribe(raw: bytes):
-            type, data = raw.decode().split(" ", 1)
-            data = self._parse_subcribe_data(type, data)
+            received = time.time()
+            topic, data = raw.split(b" ", 1)
+            # TYPE[_BIN][:SYMBOL[:TIMEFRAME]]
+            topic = topic.decode()
+            type = topic.split(":", 1)[0]
+            # "#<number> " of SEQ numbered publications, checked on receipt
+            _, data = split_sequence(data)
+            missed = self.sequences.take(topic)
+            if type.endswith(BINARY_SUFFIX):
+                type = type[: -len(BINARY_SUFFIX)]
+                data = self._parse_subcribe_binary(type, data)
+            else:
+                data = self._parse_subcribe_data(type, data.decode())
+            PARSE_SECONDS.labels(type).observe(time.time() - received)
+
+            if type == "TICKS" and self.server_offset is not None:
+                age = MESSAGE_AGE_SECONDS.labels(type)
+                for tick in data:
+                    age.observe(received - (tick["at"] - self.server_offset))
+
+            if type == "QUOTES":
+                await self.quote_cache.update(data)
+            elif type == "TICKS":
+                await self.tick_cache.update(data)
+            elif type == "BARS":
+                for symbol, timeframe, bar in data:
+                    if (symbol, timeframe) in self._bar_subscriptions:
+                        self._bar_subscriptions[(symbol, timeframe)] = bar[0]
+            elif type in ("REFRESH", "REFRESH_DELTA"):
+                self.response_cache.invalidate(*ACCOUNT_COMMANDS)
+                if not await self.account_state.update(type, data):
+                    # a missed delta, reload the whole state
+                    missed = missed or 1
+            if self._recorder is not None:
+                await self._recorder.record(type, data)
             await subscribe_callback(type, data)
 
-        await self._client.start(subscribe_callback=subcribe)
+            if missed and not self._supersedes(type, topic):
+                resync = await self._resync(type, topic, missed)
+                await subscribe_callback("RESYNC", resync)
+
+        if topics is not None:
+            topics = [topic.encode() for topic in topics]
+        await self._client.start(
+            **client_urls,
+            subscribe_callback=subcribe,
+            topics=topics,
+            policy=policy,
+            policies=policies,
+            dealer=dealer,
+            sequences=self.sequences,
+        )
 
     async def stop(self):
         if self._broker is None:
             return
 
-        self._broker.stop()
         await self._client.stop()
-
-    async def _request(self, *params: list[str | int]):
+        if self._recorder is not None:
+            await self._recorder.flush()
+        if isinstance(self._broker, MT5MQAsyncBroker):
+            await self._broker.stop()
+        else:
+            self._broker.stop()
+        self._broker = None
+
+        if self._ctx is not None:
+            self._ctx.destroy(linger=0)
+            self._ctx = None
+
+    async def _request(self, *params: list[str | int], raw=False):
+        key = (*(str(p) for p in params), raw)
+        response = await self.response_cache.get(
+            key, functools.partial(self._send, *params, raw=raw)
+        )
+        if key[0] in TRADE_COMMANDS:
+            self.response_cache.invalidate(*ACCOUNT_COMMANDS)
+        return response
+
+    async def _send(self, *params: list[str | int], raw=False):
+        timeout = self._timeouts[classify(str(params[0]).encode())] + REPLY_TIMEOUT
+        if self.account is not None:
+            params = (f"@{self.account}", *params)
         request = ";".join([str(p) for p in params])
-        response = await self._client.request(request.encode())
+        response = await self._client.request(
+            request.encode(), timeout=timeout, raw=raw
+        )
+
+        if raw:
+            status, data = response.split(b"|", 1)
+            if status == b"KO":
+                raise RuntimeError(data.decode())
+            return data
 
         response = response.split("|", 1)
         if response[0] == "KO":
@@ -50,6 +244,132 @@ class MetaTrader:
 
         return response[1]
 
+    # ----- PROTOCOL -----
+    async def negotiate(self, *features: str) -> set:
+        try:
+            data = await self._request("PROTOCOL", *features)
+        except RuntimeError as e:
+            # MTServer without PROTOCOL support only speaks text
+            logger.warning("Cannot negotiate protocol %s: %s", features, e)
+            data = ""
+
+        self.features = set(f for f in data.split(";") if f)
+
+        dispatcher = self._client.dispatcher
+        if "EVENTS" in self.features and "TOPICS" not in self.features:
+            # batches of the changed symbols only: a conflated batch loses its
+            # updates until the symbols change again
+            for type in ("BARS", "QUOTES", "TICKS"):
+                if dispatcher.policy_of(type) == POLICY_CONFLATE:
+                    logger.warning("Cannot conflate %s batches with EVENTS", type)
+                    dispatcher.set_policy(type, POLICY_BLOCK)
+        return self.features
+
+    def subscription_stats(self) -> dict[str, dict]:
+        # per topic counters of received, dropped and conflated publications
+        return self._client.dispatcher.stats()
+
+    # ----- TOPICS -----
+    def subscribe_topic(self, type: str, symbol: str = None, timeframe: str = None):
+        for topic in self._topics(type, symbol, timeframe):
+            self._client.subscribe(topic)
+
+    def unsubscribe_topic(self, type: str, symbol: str = None, timeframe: str = None):
+        topics = self._topics(type, symbol, timeframe)
+        for topic in topics:
+            self._client.unsubscribe(topic)
+
+        # the prefix of a whole type covers its binary topics too
+        names = [topic.decode().rstrip(" :") for topic in topics]
+        if symbol is None:
+            names.append(f"{type}{BINARY_SUFFIX}")
+        for name in names:
+            self.sequences.forget(name)
+
+    def _supersedes(self, type: str, topic: str) -> bool:
+        # quotes and ticks are the last values of their symbols: a publication
+        # of one symbol, or a batch of all of them without EVENTS, makes up
+        # for the missed ones
+        if type not in ("QUOTES", "TICKS"):
+            return False
+        return ":" in topic or "EVENTS" not in self.features
+
+    async def _resync(self, type: str, topic: str, missed: int) -> dict:
+        # state of the missed publications re-fetched: bars since the last
+        # received one, the quotes, or the account. -> RESYNC event data
+        SUBSCRIPTION_RESYNCS.labels(type).inc()
+        logger.warning("Resync %s after %d missed publications", topic, missed)
+
+        data = None
+        if type == "BARS":
+            data = await self._resync_bars(topic)
+        elif type in ("QUOTES", "TICKS"):
+            data = await self.get_quotes()
+            if type == "TICKS":
+                await self._resync_ticks(data)
+        elif type in ("REFRESH", "REFRESH_DELTA"):
+            data = await self.sync_account()
+        return dict(type=type, topic=topic, missed=missed, data=data)
+
+    async def _resync_ticks(self, quotes: list):
+        # last ticks of the received symbols from the re-fetched quotes, at
+        # the time of the request
+        at = time.time() + (self.server_offset or 0)
+        tick = self._output(Tick)
+        await self.tick_cache.update(
+            tick(
+                symbol=q["symbol"],
+                bid=q["bid"],
+                ask=q["ask"],
+                spread=q["spread"],
+                at=at,
+            )
+            for q in quotes
+            if q["symbol"] in self.tick_cache
+        )
+
+    async def _resync_bars(self, topic: str) -> list[tuple]:
+        # BARS[_BIN]:SYMBOL:TIMEFRAME with TOPICS, a batch of all otherwise
+        keys = list(self._bar_subscriptions)
+        if topic.count(":") == 2:
+            keys = [tuple(topic.split(":", 1)[1].split(":"))]
+
+        result = []
+        end = time.time() * 1000
+        for symbol, timeframe in keys:
+            start = self._bar_subscriptions.get((symbol, timeframe)) or end
+            bars, building = await self.get_bars(symbol, timeframe, start, end)
+            result.append((symbol, timeframe, bars))
+        return result
+
+    def _topics(self, type: str, symbol: str = None, timeframe: str = None):
+        # prefixes of the publications of a type, or of one symbol/timeframe
+        if symbol is None:
+            return [type.encode()]
+
+        if "TOPICS" not in self.features:
+            # MTServer without TOPICS publishes batches of all symbols
+            return [f"{type} ".encode(), f"{type}{BINARY_SUFFIX} ".encode()]
+
+        name = symbol if timeframe is None else f"{symbol}:{timeframe}"
+        end = ":" if type == "BARS" and timeframe is None else " "
+        return [
+            f"{type}:{name}{end}".encode(),
+            f"{type}{BINARY_SUFFIX}:{name}{end}".encode(),
+        ]
+
+    def _parse_subcribe_binary(self, type: str, data: bytes):
+        if type == "BARS":
+            return decode_bar_updates(data)
+
+        if type == "QUOTES":
+            return decode_quotes(data, self._output(Quote))
+
+        if type == "TICKS":
+            return decode_ticks(data, self._output(Tick))
+
+        raise RuntimeError(f"Cannot parse binary subscribe data: {type}")
+
     def _parse_subcribe_data(self, type: str, data: str):
         if type == "BARS":
             result = []
@@ -69,55 +389,188 @@ class MetaTrader:
             return self._parse_ticks(data)
 
         if type == "REFRESH":
-            raws = data.split("\n")
-            history_orders = []
-            history_deals = []
-            orders = []
-            trades = []
-            for raw in raws:
-                event, data = raw.split(" ", 1)
-                if not data:
-                    continue
-                if event == "HISTORY_ORDERS":
-                    history_orders.extend(self._parse_orders(data))
-                elif event == "HISTORY_DEALS":
-                    history_deals.extend(self._parse_deals(data))
-                elif event == "ORDERS":
-                    orders.extend(self._parse_orders(data))
-                elif event == "TRADES":
-                    trades.extend(self._parse_trades(data))
-
-            return dict(
-                history_orders=history_orders,
-                history_deals=history_deals,
-                orders=orders,
-                trades=trades,
-            )
+            return self._parse_refresh(data)
+
+        if type == "REFRESH_DELTA":
+            seq, data = data.split("\n", 1)
+            return dict(seq=int(seq), **self._parse_refresh(data))
 
         raise RuntimeError(f"Cannot parse subscribe data: {type} {data}")
 
+    def _parse_refresh(self, data: str) -> dict:
+        result = dict(
+            history_orders=[],
+            history_deals=[],
+            orders=[],
+            trades=[],
+            removed_orders=[],
+            removed_trades=[],
+        )
+        for raw in data.split("\n"):
+            event, data = raw.split(" ", 1)
+            if not data:
+                continue
+            if event == "HISTORY_ORDERS":
+                result["history_orders"].extend(self._parse_orders(data))
+            elif event == "HISTORY_DEALS":
+                result["history_deals"].extend(self._parse_deals(data))
+            elif event == "ORDERS":
+                result["orders"].extend(self._parse_orders(data))
+            elif event == "TRADES":
+                result["trades"].extend(self._parse_trades(data))
+            elif event in ("REMOVED_ORDERS", "REMOVED_TRADES"):
+                # tickets of the orders/trades gone since the previous delta
+                tickets = [int(ticket) for ticket in data.split(";") if ticket]
+                result[event.lower()].extend(tickets)
+        return result
+
+    def _output(self, record: type) -> type:
+        # return type of parsed quotes, ticks, trades, orders and deals
+        return record if self._records else dict
+
     # ----- MARKETS -----
     # --- Time
     async def get_time(self):
         data = await self._request("TIME")
         return float(data)
 
+    async def sync_clock(self) -> float:
+        # offset of the trade server clock, used for the age of publications
+        sent = time.time()
+        # never a cached or shared response
+        server = float(await self._send("TIME"))
+        received = time.time()
+        self.server_offset = server - (sent + received) / 2
+        return self.server_offset
+
     # --- Bars
     async def subscribe_bars(self, symbol, timeframe):
         request = "{};{}".format(symbol, timeframe)
         data = await self._request("SUB_BARS", request)
+        self._bar_subscriptions.setdefault((symbol, timeframe), None)
         return True
 
     async def unsubscribe_bars(self, symbol, timeframe):
         request = "{};{}".format(symbol, timeframe)
         data = await self._request("UNSUB_BARS", request)
+        self._bar_subscriptions.pop((symbol, timeframe), None)
         return True
 
-    async def get_bars(self, symbol, timeframe, start, end):
+    async def get_bars(self, symbol, timeframe, start, end, as_array=False):
+        if self._bar_store is not None:
+            bars, building = await self._get_stored_bars(symbol, timeframe, start, end)
+            if as_array:
+                return bars, building
+            return [list(bar) for bar in bars.tolist()], building
+
+        return await self._fetch_bars(symbol, timeframe, start, end, as_array)
+
+    async def _fetch_bars(self, symbol, timeframe, start, end, as_array=False):
         request = "{};{};{};{}".format(symbol, timeframe, start / 1000, end / 1000)
+        if "BINARY" in self.features:
+            raws = await self._request("BARS_BIN", request, raw=True)
+            bars, building = decode_bars(raws)
+            if as_array:
+                return bars, building
+            return [list(bar) for bar in bars.tolist()], building
+
         raws = await self._request("BARS", request)
+        if as_array:
+            return parse_bars_array(raws)
         return self._parse_bars(raws)
 
+    async def backfill_bars(
+        self,
+        symbol,
+        timeframe,
+        start,
+        end,
+        size=5000,
+        concurrency=5,
+        as_array=False,
+    ) -> AsyncIterator[tuple]:
+        chunks = iter(split_range(start, end, timeframe, size))
+
+        def fetch(chunk):
+            return asyncio.ensure_future(
+                self._get_bars_chunk(symbol, timeframe, *chunk, as_array=as_array)
+            )
+
+        # keep `concurrency` chunks in flight, yield them back in order
+        tasks = deque()
+        for chunk in chunks:
+            tasks.append(fetch(chunk))
+            if len(tasks) >= concurrency:
+                break
+
+        last_time = None
+        try:
+            while tasks:
+                bars, building = await tasks.popleft()
+                chunk = next(chunks, None)
+                if chunk:
+                    tasks.append(fetch(chunk))
+
+                # de-duplicate bars overlapping the previous chunk
+                if last_time is not None:
+                    if as_array:
+                        bars = bars[bars["time"] > last_time]
+                    else:
+                        bars = [bar for bar in bars if bar[0] > last_time]
+                if not len(bars):
+                    continue
+
+                last_time = bars[-1][0]
+                yield bars, building
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _get_bars_chunk(self, symbol, timeframe, start, end, as_array=False):
+        # a range without bars is an empty OK, a KO or an expired request is
+        # retried and then fails the backfill instead of leaving a hole
+        for attempt in range(1, CHUNK_ATTEMPTS + 1):
+            try:
+                return await self.get_bars(symbol, timeframe, start, end, as_array)
+            except RuntimeError as e:
+                logger.warning(
+                    "Bars %s %s %s-%s failed (%d/%d): %s",
+                    symbol,
+                    timeframe,
+                    start,
+                    end,
+                    attempt,
+                    CHUNK_ATTEMPTS,
+                    e,
+                )
+                if attempt == CHUNK_ATTEMPTS:
+                    raise RuntimeError(
+                        f"Missing bars {symbol} {timeframe} {start}-{end}: {e}"
+                    ) from e
+            await asyncio.sleep(CHUNK_RETRY_DELAY * attempt)
+
+    async def _get_stored_bars(self, symbol, timeframe, start, end):
+        store = self._bar_store
+
+        # only the parts of the range the store does not cover yet come from
+        # the terminal
+        building_bar = None
+        for gap_start, gap_end in store.missing(symbol, timeframe, start, end):
+            bars, building = await self._fetch_bars(
+                symbol, timeframe, gap_start, gap_end, as_array=True
+            )
+
+            # the building bar is returned but never persisted as closed
+            if building and len(bars):
+                building_bar = bars[-1:]
+                bars = bars[:-1]
+            store.write(symbol, timeframe, bars, start=gap_start, end=gap_end)
+
+        bars = store.read(symbol, timeframe, start, end)
+        if building_bar is not None and start <= building_bar[0]["time"] <= end:
+            return np.concatenate([bars, building_bar]), True
+        return bars, False
+
     def _parse_bars(self, data):
         raws = data.split(";")
 
@@ -151,10 +604,9 @@ class MetaTrader:
         return self._parse_markets(data)
 
     def _parse_markets(self, data):
-        raws = data.split(";")
-        markets = []
-        for raw in raws:
-            markets.append(self._parse_market(raw))
+        markets = self._market_decoder.decode(data)
+        for market in markets:
+            market["id"] = market["symbol"]
 
         self.markets = {m["id"]: m for m in markets}
         return markets
@@ -172,16 +624,21 @@ class MetaTrader:
         swapshort=float,
         swaprollover=int,
     )
+    _market_decoder = RecordDecoder(_market_format)
 
     def _parse_market(self, raw):
-        market = self._parse_data_dict(raw, self._market_format)
+        market = self._market_decoder.decode(raw)[0]
         market["id"] = market["symbol"]
         return market
 
     # --- Quote
-    async def get_quotes(self, symbols=[]):
+    async def get_quotes(self, symbols=[], cached=False):
+        if cached and symbols and all(s in self.quote_cache for s in symbols):
+            return [self.quote_cache.get(s) for s in symbols]
+
         quotes = await self._request("QUOTES")
         quotes = self._parse_quotes(quotes)
+        await self.quote_cache.update(quotes)
         if not symbols:
             return quotes
 
@@ -191,14 +648,11 @@ class MetaTrader:
                 results.append(quote)
         return results
 
+    def get_last_quote(self, symbol: str):
+        return self.quote_cache.get(symbol)
+
     def _parse_quotes(self, data):
-        raws = data.split(";")
-        quotes = []
-        for raw in raws:
-            if not raw:
-                continue
-            quotes.append(self._parse_quote(raw))
-        return quotes
+        return self._quote_decoder.decode(data, self._output(Quote))
 
     _quote_format = dict(
         open=float,
@@ -214,10 +668,10 @@ class MetaTrader:
         change=float,
         change_percent=float,
     )
+    _quote_decoder = RecordDecoder(_quote_format)
 
     def _parse_quote(self, raw):
-        quote = self._parse_data_dict(raw, self._quote_format)
-        return quote
+        return self._quote_decoder.decode(raw, self._output(Quote))[0]
 
     async def subscribe_quotes(self, symbols: list[str]):
         request = ";".join(symbols)
@@ -239,14 +693,11 @@ class MetaTrader:
         ok = await self._request("UNSUB_TICKS", symbol)
         return True
 
+    def get_last_tick(self, symbol: str):
+        return self.tick_cache.get(symbol)
+
     def _parse_ticks(self, data):
-        raws = data.split(";")
-        ticks = []
-        for raw in raws:
-            if not raw:
-                continue
-            ticks.append(self._parse_tick(raw))
-        return ticks
+        return self._tick_decoder.decode(data, self._output(Tick))
 
     _tick_format = dict(
         bid=float,
@@ -254,10 +705,10 @@ class MetaTrader:
         spread=float,
         at=float,
     )
+    _tick_decoder = RecordDecoder(_tick_format)
 
     def _parse_tick(self, raw):
-        tick = self._parse_data_dict(raw, self._tick_format)
-        return tick
+        return self._tick_decoder.decode(raw, self._output(Tick))[0]
 
     # ---- ACCOUNT ----
     # ---- Account
@@ -290,6 +741,16 @@ class MetaTrader:
         fund = self._parse_data_dict(raw, self._fund_format)
         return fund
 
+    # ---- State
+    async def sync_account(self, fromdate=None) -> AccountState:
+        # full snapshot of orders, trades and the history since `fromdate`
+        # (default: the oldest open order), followed by REFRESH_DELTA
+        # publications once DELTA is negotiated
+        data = await self._request("REFRESH", "" if fromdate is None else fromdate)
+        seq, data = data.split("\n", 1)
+        await self.account_state.apply_snapshot(self._parse_refresh(data), int(seq))
+        return self.account_state
+
     # ---- Trades
     async def get_trades(self, symbol=""):
         data = await self._request("TRADES", symbol)
@@ -304,16 +765,18 @@ class MetaTrader:
         data = await self._request("CLOSE_TRADE", ticket)
         return True
 
-    def _parse_trades(self, data):
-        raws = data.split(";")
-        trades = []
-        for raw in raws:
-            if not raw:
-                continue
+    async def modify_trades(self, trades: list[tuple]) -> list:
+        # [(ticket, sl, tp)...] in one request
+        return await self.batch(
+            ("MODIFY_TRADE", f"{ticket};{sl or 0};{tp or 0}")
+            for ticket, sl, tp in trades
+        )
 
-            trade = self._parse_trade(raw)
-            trades.append(trade)
-        return trades
+    async def close_trades(self, tickets: list[int]) -> list:
+        return await self.batch(("CLOSE_TRADE", ticket) for ticket in tickets)
+
+    def _parse_trades(self, data):
+        return self._trade_decoder.decode(data, self._output(Trade))
 
     _trade_format = dict(
         ticket=int,
@@ -325,11 +788,10 @@ class MetaTrader:
         pnl=float,
         swap=float,
     )
+    _trade_decoder = RecordDecoder(_trade_format, millis=("open_time",))
 
     def _parse_trade(self, raw):
-        trade = self._parse_data_dict(raw, self._trade_format)
-        trade["open_time"] = trade["open_time"] * 1000
-        return trade
+        return self._trade_decoder.decode(raw, self._output(Trade))[0]
 
     # ---- Deals
     async def get_deals(self, symbol="", fromdate=0):
@@ -338,15 +800,8 @@ class MetaTrader:
         return self._parse_deals(data)
 
     def _parse_deals(self, data):
-        raws = data.split(";")
-        deals = []
-        for raw in raws:
-            if not raw:
-                continue
-            deal = self._parse_deal(raw)
-            if deal:
-                deals.append(deal)
-        return deals
+        deals = self._deal_decoder.decode(data, self._output(Deal))
+        return [deal for deal in deals if deal["type"] != "DEAL_TYPE_BALANCE"]
 
     _deal_format = dict(
         ticket=int,
@@ -361,13 +816,12 @@ class MetaTrader:
         pnl=float,
         commission=float,
     )
+    _deal_decoder = RecordDecoder(_deal_format, millis=("time",))
 
     def _parse_deal(self, raw):
-        deal = self._parse_data_dict(raw, self._deal_format)
+        deal = self._deal_decoder.decode(raw, self._output(Deal))[0]
         if deal["type"] == "DEAL_TYPE_BALANCE":
             return None
-
-        deal["time"] = deal["time"] * 1000
         return deal
 
     # ---- Orders
@@ -376,15 +830,7 @@ class MetaTrader:
         return self._parse_orders(data)
 
     def _parse_orders(self, data):
-        raws = data.split(";")
-        orders = []
-        for raw in raws:
-            if not raw:
-                continue
-
-            order = self._parse_order(raw)
-            orders.append(order)
-        return orders
+        return self._order_decoder.decode(data, self._output(Order))
 
     _order_format = dict(
         ticket=int,
@@ -397,21 +843,21 @@ class MetaTrader:
         tp=float,
         expiration=float,
     )
+    _order_decoder = RecordDecoder(
+        _order_format,
+        millis=("open_time", "close_time", "expiration"),
+    )
 
     def _parse_order(self, raw):
-        order = self._parse_data_dict(raw, self._order_format)
-        order["open_time"] = order["open_time"] * 1000
-        order["close_time"] = order["close_time"] * 1000
-        order["expiration"] = order["expiration"] * 1000
-        return order
+        return self._order_decoder.decode(raw, self._output(Order))[0]
 
     async def open_order(self, symbol, type, lots, price, sl=0, tp=0, comment=""):
-        request = f"{symbol};{type};{lots};{price or 0};{sl or 0};{tp or 0};{comment}"
+        request = self._open_order_request(symbol, type, lots, price, sl, tp, comment)
         ticket = await self._request("OPEN_ORDER", request)
         return int(ticket)
 
     async def modify_order(self, ticket, price, sl=0, tp=0, expiration=0):
-        request = f"{ticket};{price or 0};{sl or 0};{tp or 0};{expiration or 0}"
+        request = self._modify_order_request(ticket, price, sl, tp, expiration)
         data = await self._request("MODIFY_ORDER", request)
         return True
 
@@ -419,6 +865,58 @@ class MetaTrader:
         data = await self._request("CANCEL_ORDER", ticket)
         return True
 
+    async def open_orders(self, orders: list[tuple]) -> list:
+        # [(symbol, type, lots, price[, sl, tp, comment])...] in one request
+        return await self.batch(
+            ("OPEN_ORDER", self._open_order_request(*order)) for order in orders
+        )
+
+    async def modify_orders(self, orders: list[tuple]) -> list:
+        # [(ticket, price[, sl, tp, expiration])...] in one request
+        return await self.batch(
+            ("MODIFY_ORDER", self._modify_order_request(*order)) for order in orders
+        )
+
+    async def cancel_orders(self, tickets: list[int]) -> list:
+        return await self.batch(("CANCEL_ORDER", ticket) for ticket in tickets)
+
+    def _open_order_request(self, symbol, type, lots, price, sl=0, tp=0, comment=""):
+        return f"{symbol};{type};{lots};{price or 0};{sl or 0};{tp or 0};{comment}"
+
+    def _modify_order_request(self, ticket, price, sl=0, tp=0, expiration=0):
+        return f"{ticket};{price or 0};{sl or 0};{tp or 0};{expiration or 0}"
+
+    # ---- Batch
+    async def batch(self, operations) -> list:
+        # (command, params) trade operations sent in one BATCH request and
+        # executed back to back by the terminal. Results in order: the
+        # ticket of an opened order, True, or the RuntimeError of a failed
+        # operation, the other operations are still executed.
+        operations = [(command, str(params)) for command, params in operations]
+        if not operations:
+            return []
+        request = "\n".join(f"{command};{params}" for command, params in operations)
+        data = await self._request("BATCH", request)
+
+        lines = data.split("\n")
+        if len(lines) != len(operations):
+            raise RuntimeError(
+                f"BATCH replied {len(lines)} results for {len(operations)} operations"
+            )
+
+        results = []
+        for (command, params), line in zip(operations, lines):
+            status, _, value = line.partition("|")
+            if status != "OK":
+                results.append(RuntimeError(f"{command} {params}: {value or line}"))
+            elif command != "OPEN_ORDER":
+                results.append(True)
+            elif value.isdigit():
+                results.append(int(value))
+            else:
+                results.append(RuntimeError(f"{command} {params}: bad ticket {value}"))
+        return results
+
     # helpers
     def _parse_data_dict(self, raws, format):
         raws = raws.split("|")
@@ -1,23 +1,194 @@
 import logging
-import queue
+import os
+import tempfile
 import threading
 import time
-from collections import OrderedDict
+from collections import OrderedDict, deque
 
 import zmq
 
+from .metrics import (
+    BROKER_EXPIRED,
+    BROKER_QUEUE_DEPTH,
+    BROKER_QUEUE_SECONDS,
+    BROKER_REJECTED,
+    WORKER_SECONDS,
+    WORKERS,
+)
+
 logger = logging.getLogger("PyMetaTrader:MT5MQBroker")
 
 PINGLIVENESS = 10  # 3..5 is reasonable
 PING_INTERVAL = 10  # Seconds
+REQUEST_TIMEOUT = 30  # Seconds
+MAX_REQUESTS = 1000
+MAX_SUBCRIBE_REQUESTS = 10000
+
+# Routing of requests over the connected workers (MTServer terminals)
+POLICY_ANY = "any"
+POLICY_LEAST_OUTSTANDING = "least_outstanding"
+POLICY_AFFINITY = "affinity"
+POLICIES = (POLICY_ANY, POLICY_LEAST_OUTSTANDING, POLICY_AFFINITY)
+
+# Requests prefixed with "@<account>;" only go to the workers of that account,
+# workers announce their account with "READY;<account>"
+ACCOUNT_PREFIX = b"@"
+SYMBOL_COMMANDS = (b"BARS", b"BARS_BIN", b"SUB_BARS", b"UNSUB_BARS", b"OPEN_ORDER")
+SUBCRIBE_COMMANDS = (b"SUB", b"UNSUB")
+
+# Client address of the requests sent by the broker itself
+INTERNAL_ADDRESS = b"Broker"
+
+# Priority classes of the queued client requests, highest first. Waiting
+# requests are dispatched by weighted round robin over the classes and
+# expire after the timeout of their class, e.g. an order must not reach
+# the terminal long after it was sent.
+PRIORITY_TRADE = "trade"
+PRIORITY_ACCOUNT = "account"
+PRIORITY_QUOTES = "quotes"
+PRIORITY_HISTORY = "history"
+PRIORITY_COMMANDS = {
+    PRIORITY_TRADE: (
+        b"OPEN_ORDER",
+        b"MODIFY_ORDER",
+        b"CANCEL_ORDER",
+        b"MODIFY_TRADE",
+        b"CLOSE_TRADE",
+        b"BATCH",
+    ),
+    PRIORITY_ACCOUNT: (b"ACCOUNT", b"FUND", b"ORDERS", b"TRADES"),
+    PRIORITY_QUOTES: (b"QUOTES", b"MARKETS", b"TIME", b"PROTOCOL"),
+    PRIORITY_HISTORY: (b"BARS", b"BARS_BIN", b"DEALS"),
+}
+PRIORITY_WEIGHTS = {
+    PRIORITY_TRADE: 8,
+    PRIORITY_ACCOUNT: 4,
+    PRIORITY_QUOTES: 2,
+    PRIORITY_HISTORY: 1,
+}
+PRIORITY_TIMEOUTS = {  # Seconds
+    PRIORITY_TRADE: 10,
+    PRIORITY_ACCOUNT: 30,
+    PRIORITY_QUOTES: 10,
+    PRIORITY_HISTORY: 60,
+}
+# Seconds a dispatched request may take, clients wait for the timeout of its
+# class plus this so that the broker never dispatches an abandoned request
+REPLY_TIMEOUT = 10
+PRIORITY_CLASSES = {
+    command: priority
+    for priority, commands in PRIORITY_COMMANDS.items()
+    for command in commands
+}
+
+
+def classify(request: bytes) -> str:
+    # priority class of a request, without an "@<account>;" prefix
+    command = request.split(b";", 1)[0]
+    return PRIORITY_CLASSES.get(command, PRIORITY_QUOTES)
+
+
+# DEALER clients pipeline requests as [b"", correlation id, request], the
+# broker hands the correlation id to the worker inside the client address
+CORRELATION_SEP = b"#"
+
+
+def _worker_address(data: list) -> bytes:
+    # [client, b"", correlation id, request] -> client#correlation
+    if len(data) != 4:
+        return data[0]
+    return data[0] + CORRELATION_SEP + data[2]
+
+
+def _uncorrelate(reply: list) -> list:
+    # [client#correlation, b"", response] -> [client, b"", correlation, response]
+    address, correlation = reply[0].rsplit(CORRELATION_SEP, 1)
+    return [address, b"", correlation] + reply[2:]
+
+
+class _RequestQueue(object):
+    def __init__(
+        self,
+        weights: dict[str, int] = None,
+        timeouts: dict[str, float] = None,
+        size=MAX_REQUESTS,
+    ):
+        self.weights = {**PRIORITY_WEIGHTS, **(weights or dict())}
+        self.timeouts = {**PRIORITY_TIMEOUTS, **(timeouts or dict())}
+        self.size = size
+        self.lanes: dict[str, deque] = {p: deque() for p in PRIORITY_COMMANDS}
+        self.credits = dict(self.weights)
+
+    def __len__(self) -> int:
+        return sum(len(lane) for lane in self.lanes.values())
+
+    def put(self, msg: list, account: bytes = None, symbol: bytes = None) -> bool:
+        priority = classify(msg[-1])
+        lane = self.lanes[priority]
+        if len(lane) >= self.size:
+            return False
+
+        now = time.time()
+        lane.append((msg, now + self.timeouts[priority], account, symbol, now))
+        return True
+
+    def take(self, workers: "_WorkerQueue", worker: "_Worker") -> list | None:
+        for _ in range(2):
+            for priority, lane in self.lanes.items():
+                if not lane or self.credits[priority] <= 0:
+                    continue
+                item = workers.take(lane, worker)
+                if item is not None:
+                    self.credits[priority] -= 1
+                    BROKER_QUEUE_SECONDS.labels(priority).observe(time.time() - item[4])
+                    return item[0]
+
+            # the classes with requests for this worker used up their turns
+            self.credits = dict(self.weights)
+        return None
+
+    def observe(self):
+        for priority, lane in self.lanes.items():
+            BROKER_QUEUE_DEPTH.labels(priority).set(len(lane))
+
+
+def _route(request: bytes) -> tuple[bytes | None, bytes | None, bytes]:
+    # -> (account, symbol, request without the account prefix)
+    account = None
+    if request.startswith(ACCOUNT_PREFIX):
+        account, _, request = request[len(ACCOUNT_PREFIX) :].partition(b";")
+
+    symbol = None
+    fields = request.split(b";", 2)
+    if fields[0] in SYMBOL_COMMANDS and len(fields) > 1:
+        symbol = fields[1]
+    return account, symbol, request
+
+
+def _capacity(field: bytes) -> int:
+    # requests a worker takes at once, 1 unless announced as a positive int
+    try:
+        capacity = int(field)
+    except ValueError:
+        capacity = 0
+    if capacity < 1:
+        logger.warning("Invalid worker capacity %r, using 1", field)
+        return 1
+    return capacity
 
 
 class _Worker(object):
     expiry: int
-    data: list
 
-    def __init__(self, address: bytes):
+    def __init__(self, address: bytes, account: bytes = None, capacity=1):
         self.address = address
+        self.account = account
+        # requests sent at once, more than 1 from DEALER workers which reply
+        # in order: (request, sent at) of every outstanding request
+        self.capacity = capacity
+        self.inflight: deque[tuple[list, float]] = deque()
+        self.outstanding = 0
+        self.served = 0
         self.expiry = time.time() + PING_INTERVAL * PINGLIVENESS
 
     def expiry_update(self):
@@ -29,60 +200,137 @@ class _Worker(object):
     def is_expired(self) -> bool:
         return self.expiry <= time.time()
 
+    def accepts(self, account: bytes = None) -> bool:
+        return account is None or account == self.account
+
+    def free(self) -> int:
+        return self.capacity - self.outstanding
+
     def request(self, data: list, socket: zmq.Socket):
-        self.data = data
+        self.inflight.append((data, time.time()))
+        self.outstanding += 1
         self.expiry_update()
 
+        if len(data) == 4:
+            data = [_worker_address(data), b"", data[3]]
         request = [self.address, b""] + data
         socket.send_multipart(request)
 
         # print("---> Broker request:", request)
 
     def reply(self, reply, socket: zmq.Socket):
-        if not self.data:
+        if not self.inflight:
             return
+        data, sent_at = self.inflight.popleft()
 
-        socket.send_multipart(reply)
-        self.data = None
+        # replies to pings and to subscriptions replayed by the broker stay here
+        if data[0] not in (INTERNAL_ADDRESS, b"PING"):
+            # only requests of DEALER clients carry a correlation id
+            if len(data) == 4:
+                reply = _uncorrelate(reply)
+            socket.send_multipart(reply)
+            WORKER_SECONDS.observe(time.time() - sent_at)
+
+        self.outstanding -= 1
+        self.served += 1
 
         # print("---> Broker reply:", reply[0], reply[2][0:10])
 
 
 class _WorkerQueue(object):
-    def __init__(self, client_socket: zmq.Socket, worker_socket: zmq.Socket):
+    def __init__(
+        self,
+        client_socket: zmq.Socket,
+        worker_socket: zmq.Socket,
+        policy=POLICY_LEAST_OUTSTANDING,
+    ):
+        if policy not in POLICIES:
+            raise RuntimeError(f"Unknown routing policy: {policy}")
+
         self.client_socket: zmq.Socket = client_socket
         self.worker_socket: zmq.Socket = worker_socket
+        self.policy = policy
+        self.workers: dict[bytes, _Worker] = dict()
+        # workers with a free request slot, and with outstanding requests: a
+        # worker of capacity > 1 can be in both
         self.queue: OrderedDict[bytes, _Worker] = OrderedDict()
         self.waiting: OrderedDict[bytes, _Worker] = OrderedDict()
+        self.affinity: dict[bytes, bytes] = dict()
+
+        # subscription role, and the SUB/UNSUB requests replayed on failover
+        self.publisher: bytes | None = None
+        self.publisher_account: bytes | None = None
+        self.subscriptions: list[bytes] = []
+
+    def seen(self, address: bytes, account: bytes = None, capacity=1) -> _Worker:
+        worker = self.workers.get(address)
+        if worker is None:
+            worker = _Worker(address=address, account=account, capacity=capacity)
+            self.workers[address] = worker
+            logger.info(
+                "Worker registered: %s account %s capacity %s",
+                address,
+                account,
+                capacity,
+            )
+        elif account is not None:
+            worker.account = account
+        worker.expiry_update()
+        return worker
 
     def ready(self, worker: _Worker):
-        self.waiting.pop(worker.address, None)
+        if not worker.outstanding:
+            self.waiting.pop(worker.address, None)
         self.queue[worker.address] = worker
 
-    def next(self) -> _Worker:
-        while True:
-            try:
-                address, worker = self.queue.popitem()
-            except KeyError as e:
-                raise TimeoutError() from e
+    def next(self, account: bytes = None, symbol: bytes = None) -> _Worker:
+        for address, worker in list(self.queue.items()):
+            if worker.is_expired():
+                logger.debug("Worker expired: %s %s", address, worker.expiry)
+                self.remove(address)
+
+        candidates = [w for w in self.queue.values() if w.accepts(account)]
+        if not candidates:
+            raise TimeoutError()
+
+        worker = None
+        if self.policy == POLICY_AFFINITY and symbol is not None:
+            preferred = self.affinity.get(symbol)
+            worker = next((w for w in candidates if w.address == preferred), None)
+
+        if worker is None:
+            if self.policy == POLICY_ANY:
+                worker = candidates[-1]
+            else:
+                # ties go to the worker idle for the longest time
+                worker = min(candidates, key=lambda w: w.outstanding)
 
-            if not worker.is_expired():
-                return worker
-            logger.debug("Worker expired: %s %s", address, worker.expiry)
+            if symbol is not None and self.affinity.get(symbol) not in self.workers:
+                self.affinity[symbol] = worker.address
+
+        del self.queue[worker.address]
+        return worker
 
     def remove(self, address: bytes):
-        worker: _Worker = self.queue.pop(address, None)
+        worker: _Worker = self.workers.pop(address, None)
+        self.queue.pop(address, None)
         if worker:
             worker.expiry = 0
+        for symbol in [s for s, a in self.affinity.items() if a == address]:
+            del self.affinity[symbol]
 
     def purge(self):
         if not self.waiting:
             return
 
-        for worker in self.waiting.values():
+        for worker in list(self.waiting.values()):
             if worker.is_expired():
-                worker.reply("KO|Expired", self.client_socket)
+                while worker.inflight:
+                    BROKER_EXPIRED.inc()
+                    address = _worker_address(worker.inflight[0][0])
+                    worker.reply([address, b"", b"KO|Expired"], self.client_socket)
                 self.waiting.pop(worker.address, None)
+                self.remove(worker.address)
 
     def request(
         self,
@@ -90,6 +338,8 @@ class _WorkerQueue(object):
         address: bytes = None,
         is_wait=False,
         do_raise=True,
+        account: bytes = None,
+        symbol: bytes = None,
     ):
         worker: _Worker = None
         if address:
@@ -100,30 +350,309 @@ class _WorkerQueue(object):
             else:
                 if do_raise:
                     raise TimeoutError()
-                worker = _Worker(address=address)
+                worker = self.seen(address)
 
         if not worker:
-            worker = self.next()
+            worker = self.next(account=account, symbol=symbol)
 
         self.waiting[worker.address] = worker
         worker.request(request, socket=self.worker_socket)
+        if worker.free() > 0 and worker.address in self.workers:
+            self.queue[worker.address] = worker
 
     def reply(self, reply: list, address, abandon=True):
         if abandon and address not in self.waiting:
             logger.warning("Abandon worker %s %s", address, reply)
         else:
-            worker = self.waiting.pop(address, None)
+            worker = self.waiting.get(address)
             if worker:
                 worker.reply(reply, self.client_socket)
+                if not worker.outstanding:
+                    del self.waiting[address]
+            elif reply[0] != INTERNAL_ADDRESS:
+                self.client_socket.send_multipart(reply)
+
+    # Subscription role
+    def log_subscription(self, request: bytes):
+        if request == b"UNSUB_ALL":
+            self.subscriptions.clear()
+            return
+
+        # an UNSUB cancels the same SUB instead of piling up
+        if request.startswith(b"UNSUB_"):
+            sub = request[2:]
+            if sub in self.subscriptions:
+                self.subscriptions.remove(sub)
+                return
+        self.subscriptions.append(request)
+
+    def failover(self, force=False) -> list[list]:
+        # hand the subscription role to a live worker, preferring the previous
+        # one then one of the same account, and return the subscriptions to
+        # replay on it
+        previous = self.publisher
+        if previous is not None:
+            if previous in self.workers and not force:
+                return []
+            logger.warning("Publisher worker lost: %s", previous)
+
+        account = self.publisher_account
+        candidates = sorted(
+            self.workers.values(),
+            key=lambda w: (w.address != previous, w.account != account),
+        )
+        if not candidates:
+            self.publisher = None
+            return []
+
+        self.publisher = candidates[0].address
+        self.publisher_account = candidates[0].account
+        logger.info("Publisher worker: %s", self.publisher)
+        return [[INTERNAL_ADDRESS, b"", s] for s in self.subscriptions]
+
+    def take(self, requests: deque, worker: _Worker) -> tuple | None:
+        # oldest queued request this worker can serve, dropping expired ones
+        # -> (request, expiry, account, symbol, queued at)
+        now = time.time()
+        while requests and requests[0][1] <= now:
+            logger.warning("Expired request: %s", requests.popleft()[0])
+            BROKER_EXPIRED.inc()
+
+        index = None
+        for i, (_, _, account, symbol, _) in enumerate(requests):
+            if not worker.accepts(account):
+                continue
+            if index is None:
+                index = i
+            if self.policy != POLICY_AFFINITY:
+                break
+            # prefer the requests of the symbols this worker already serves
+            if symbol is not None and self.affinity.get(symbol) == worker.address:
+                index = i
+                break
+
+        if index is None:
+            return None
+
+        item = requests[index]
+        del requests[index]
+        symbol = item[3]
+        if symbol is not None and self.affinity.get(symbol) not in self.workers:
+            self.affinity[symbol] = worker.address
+        return item
+
+    def observe(self):
+        WORKERS.labels("idle").set(
+            sum(1 for worker in self.queue.values() if not worker.outstanding)
+        )
+        WORKERS.labels("busy").set(len(self.waiting))
+
+
+def transport_urls(transport="tcp", name="pymetatrader") -> tuple[dict, dict]:
+    # client side endpoints of a broker: (MT5MQBroker.start urls,
+    # MT5MQClient.start urls), inproc:// needs a context shared by both
+    match transport:
+        case "tcp":
+            return (
+                dict(
+                    request_client_url="tcp://*:22880",
+                    pubsub_client_url="tcp://*:22881",
+                ),
+                dict(
+                    request_url="tcp://127.0.0.1:22880",
+                    subscribe_url="tcp://127.0.0.1:22881",
+                ),
+            )
+        case "inproc":
+            request_url = f"inproc://{name}-request"
+            subscribe_url = f"inproc://{name}-subscribe"
+        case "ipc":
+            path = os.path.join(tempfile.gettempdir(), name)
+            request_url = f"ipc://{path}-request.ipc"
+            subscribe_url = f"ipc://{path}-subscribe.ipc"
+        case _:
+            raise RuntimeError(f"Unknown transport: {transport}")
+
+    return (
+        dict(request_client_url=request_url, pubsub_client_url=subscribe_url),
+        dict(request_url=request_url, subscribe_url=subscribe_url),
+    )
+
+
+def _bind(ctx: zmq.Context, type: int, url: str, identity: bytes = None):
+    socket: zmq.Socket = ctx.socket(type)
+    if identity is not None:
+        socket.setsockopt(zmq.IDENTITY, identity)
+    socket.setsockopt(zmq.SNDHWM, 10000)
+    socket.bind(url)
+    return socket
+
+
+class _Router(object):
+    # Request routing between the client and the worker ROUTER sockets, fed
+    # with received messages by the threaded or the asyncio broker loop.
+
+    def __init__(
+        self,
+        client_socket: zmq.Socket,
+        worker_socket: zmq.Socket,
+        policy=POLICY_LEAST_OUTSTANDING,
+        weights: dict[str, int] = None,
+        timeouts: dict[str, float] = None,
+    ):
+        self.client_socket = client_socket
+        self.worker_socket = worker_socket
+        self.workers = _WorkerQueue(
+            client_socket=client_socket,
+            worker_socket=worker_socket,
+            policy=policy,
+        )
+        self.ping_at = time.time() + PING_INTERVAL
+
+        self.q_requests = _RequestQueue(weights=weights, timeouts=timeouts)
+        # (request, expiry, account, symbol, queued at)
+        self.q_subcribe_requests = deque()
+
+    def on_worker(self, msg: list):
+        workers = self.workers
+        address = msg[0]
+
+        match msg[2]:
+            case ready if ready.startswith(b"READY"):
+                logger.info("New work connected: %s", msg)
+                # READY[;<account>[;<capacity>]]
+                fields = ready.split(b";")
+                account = fields[1] if len(fields) > 1 and fields[1] else None
+                capacity = _capacity(fields[2]) if len(fields) > 2 else 1
+                # a restarted terminal starts without subscriptions
+                workers.waiting.pop(address, None)
+                workers.remove(address)
+                worker = workers.seen(address, account=account, capacity=capacity)
+                self._failover(force=address == workers.publisher)
+            case b"PING":
+                logger.info("PONG: %s", msg)
+                worker = workers.seen(address)
+                # MTServer echoes the PING address, release the ping in flight
+                if worker.inflight and worker.inflight[0][0][0] == b"PING":
+                    workers.reply(msg[2:], address=address)
+            case b"CLOSE":
+                logger.info("Close work connection: %s", msg)
+                workers.remove(address)
+                self._failover()
+                return
+            case _:
+                worker = workers.seen(address)
+                reply = msg[2:]
+                workers.reply(reply, address=address)
+
+        # unless busy with a replayed subscription or already idle
+        if worker.free() > 0 and address not in workers.queue:
+            self._dispatch(worker)
+
+    def on_client(self, msg: list):
+        workers = self.workers
+        # [client, b"", request] or, from DEALER clients, with a correlation id
+        # before the request
+        account, symbol, msg[-1] = _route(msg[-1])
+
+        is_subcribe = msg[-1].startswith(SUBCRIBE_COMMANDS)
+        if is_subcribe:
+            workers.log_subscription(msg[-1])
+
+        try:
+            if is_subcribe:
+                if workers.publisher is None:
+                    raise TimeoutError()
+                workers.request(msg, address=workers.publisher)
+            else:
+                workers.request(msg, account=account, symbol=symbol)
+                priority = classify(msg[-1])
+                BROKER_QUEUE_SECONDS.labels(priority).observe(0)
+        except TimeoutError:
+            if not is_subcribe:
+                queued = self.q_requests.put(msg, account=account, symbol=symbol)
+            elif len(self.q_subcribe_requests) < MAX_SUBCRIBE_REQUESTS:
+                now = time.time()
+                expiry = now + REQUEST_TIMEOUT
+                self.q_subcribe_requests.append((msg, expiry, account, symbol, now))
+                queued = True
             else:
+                queued = False
+
+            if not queued:
+                BROKER_REJECTED.inc()
+                reply = msg[:-1] + [b"KO|Too many requests"]
                 self.client_socket.send_multipart(reply)
 
+    def maintain(self):
+        workers = self.workers
+        workers.purge()
+        self._failover()
+
+        # Send ping to idle workers if it's time
+        if time.time() >= self.ping_at:
+            for worker in list(workers.queue.values()):
+                if not worker.outstanding:
+                    workers.request([b"PING"], address=worker.address)
+            self.ping_at = time.time() + PING_INTERVAL
+
+        self.q_requests.observe()
+        BROKER_QUEUE_DEPTH.labels("subscribe").set(len(self.q_subcribe_requests))
+        workers.observe()
+
+    def _dispatch(self, worker: _Worker):
+        # queued requests up to the free slots of the worker
+        workers = self.workers
+        while worker.free() > 0:
+            request = None
+            if worker.address == workers.publisher:
+                item = workers.take(self.q_subcribe_requests, worker)
+                request = item[0] if item is not None else None
+            if request is None:
+                request = self.q_requests.take(workers, worker)
+
+            if request is None:
+                workers.ready(worker)
+                return
+
+            workers.request(
+                request,
+                address=worker.address,
+                is_wait=True,
+                do_raise=False,
+            )
+
+    def _failover(self, force=False):
+        workers = self.workers
+        replay = workers.failover(force=force)
+        if not replay:
+            return
+
+        now = time.time()
+        expiry = now + REQUEST_TIMEOUT
+        self.q_subcribe_requests.extendleft(
+            (request, expiry, None, None, now) for request in reversed(replay)
+        )
+        publisher = workers.queue.get(workers.publisher)
+        if publisher is not None:
+            del workers.queue[publisher.address]
+            self._dispatch(publisher)
+
 
 class MT5MQBroker:
     _ctx: zmq.Context
 
-    def __init__(self) -> None:
-        self._ctx = zmq.Context()
+    def __init__(
+        self,
+        policy=POLICY_LEAST_OUTSTANDING,
+        weights: dict[str, int] = None,
+        timeouts: dict[str, float] = None,
+        ctx: zmq.Context | None = None,
+    ) -> None:
+        self._ctx = ctx or zmq.Context()
+        self.policy = policy
+        self.weights = weights
+        self.timeouts = timeouts
 
     def start(
         self,
@@ -158,29 +687,23 @@ class MT5MQBroker:
         request_worker_thread.start()
 
     def _t_request(self, client_url: str, worker_url: str):
-        client_socket: zmq.Socket = self._ctx.socket(zmq.ROUTER)
-        client_socket.setsockopt(zmq.IDENTITY, b"CBroker")
-        client_socket.setsockopt(zmq.SNDHWM, 10000)
-        client_socket.bind(client_url)
+        client_socket = _bind(self._ctx, zmq.ROUTER, client_url, identity=b"CBroker")
         logger.info("REQ listening for client on %s", client_url)
 
-        worker_socket: zmq.Socket = self._ctx.socket(zmq.ROUTER)
-        worker_socket.setsockopt(zmq.IDENTITY, b"WBroker")
-        worker_socket.setsockopt(zmq.SNDHWM, 10000)
-        worker_socket.bind(worker_url)
+        worker_socket = _bind(self._ctx, zmq.ROUTER, worker_url, identity=b"WBroker")
         logger.info("REQ listening for worker on %s", worker_url)
 
         poller = zmq.Poller()
         poller.register(client_socket, zmq.POLLIN)
         poller.register(worker_socket, zmq.POLLIN)
 
-        workers = _WorkerQueue(client_socket=client_socket, worker_socket=worker_socket)
-        ping_at = time.time() + PING_INTERVAL
-
-        q_requests = queue.Queue(1000)
-        q_subcribe_requests = queue.Queue(10000)
-
-        publisher_address = None
+        router = _Router(
+            client_socket=client_socket,
+            worker_socket=worker_socket,
+            policy=self.policy,
+            weights=self.weights,
+            timeouts=self.timeouts,
+        )
 
         while True:
             socks = dict(poller.poll(PING_INTERVAL * 1000))
@@ -190,80 +713,16 @@ class MT5MQBroker:
                 msg = worker_socket.recv_multipart()
                 if not msg:
                     break
-
-                address = msg[0]
-
-                match msg[2]:
-                    case b"READY":
-                        logger.info("New work connected: %s", msg)
-                        if publisher_address is None:
-                            publisher_address = address
-                    case b"PING":
-                        logger.info("PONG: %s", msg)
-                    case b"CLOSE":
-                        logger.info("Close work connection: %s", msg)
-                        workers.remove(address)
-                        continue
-                    case _:
-                        reply = msg[2:]
-                        workers.reply(reply, address=address)
-
-                try:
-                    while True:
-                        # Get params
-                        request, expiry = None, None
-                        if address == publisher_address:
-                            try:
-                                request, expiry = q_subcribe_requests.get_nowait()
-                            except queue.Empty:
-                                pass
-                        if not request:
-                            request, expiry = q_requests.get_nowait()
-
-                        # Check expiry
-                        if expiry > time.time():
-                            break
-                        logger.warning("Expired request: %s", request)
-
-                    # Request
-                    workers.request(
-                        request,
-                        address=address,
-                        is_wait=True,
-                        do_raise=False,
-                    )
-                except queue.Empty:
-                    workers.ready(_Worker(address=address))
+                router.on_worker(msg)
 
             # Client socket
             if socks.get(client_socket) == zmq.POLLIN:
                 msg = client_socket.recv_multipart()
                 if not msg:
                     break
+                router.on_client(msg)
 
-                is_subcribe = publisher_address and (
-                    msg[2].startswith(b"SUB") or msg[2].startswith(b"UNSUB")
-                )
-
-                try:
-                    address = publisher_address if is_subcribe else None
-                    workers.request(msg, address=address, is_wait=False, do_raise=True)
-                except TimeoutError:
-                    if is_subcribe:
-                        q_subcribe_requests.put((msg, time.time() + 30))
-                    else:
-                        q_requests.put((msg, time.time() + 30))
-
-            workers.purge()
-            # Send ping to idle workers if it's time
-            if time.time() >= ping_at:
-                try:
-                    for _ in range(len(workers.queue)):
-                        worker = workers.next()
-                        worker.request([b"PING"], socket=worker_socket)
-                        ping_at = time.time() + PING_INTERVAL
-                except TimeoutError:
-                    pass
+            router.maintain()
 
     # XPUB/XSUB
     def _start_xpub_xsub(self, client_url: str, worker_url: str):
@@ -274,9 +733,7 @@ class MT5MQBroker:
         thread.start()
 
     def _t_xpub_xsub(self, client_url: str, worker_url: str):
-        client_socket: zmq.Socket = self._ctx.socket(zmq.XPUB)
-        client_socket.setsockopt(zmq.SNDHWM, 10000)
-        client_socket.bind(client_url)
+        client_socket = _bind(self._ctx, zmq.XPUB, client_url)
         logger.info("XPUB-XSUB listening for client on %s", client_url)
 
         worker_socket = self._ctx.socket(zmq.XSUB)
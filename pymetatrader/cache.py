@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Iterable, Mapping
+
+from .metrics import RESPONSE_CACHE
+
+logger = logging.getLogger("PyMetaTrader:Cache")
+
+
+class LastValueCache:
+    # Latest quote/tick per symbol, fed from the subscription stream.
+    # Listeners are awaited with each record that differs from the cached one.
+
+    def __init__(self):
+        self._values: dict[str, Mapping] = dict()
+        self._listeners: list[Callable] = []
+
+    def get(self, symbol: str) -> Mapping | None:
+        return self._values.get(symbol)
+
+    def symbols(self) -> list[str]:
+        return list(self._values)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._values
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add_listener(self, listener: Callable):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable):
+        self._listeners.remove(listener)
+
+    async def update(self, records: Iterable[Mapping]) -> list[Mapping]:
+        changed = []
+        values = self._values
+        for record in records:
+            symbol = record["symbol"]
+            if values.get(symbol) == record:
+                continue
+            values[symbol] = record
+            changed.append(record)
+
+        for record in changed:
+            for listener in self._listeners:
+                try:
+                    await listener(record)
+                except Exception:
+                    logger.exception("Cache listener failed for %s", record)
+        return changed
+
+    def clear(self):
+        self._values.clear()
+
+
+class ResponseCache:
+    # Single flight and short TTL cache of idempotent requests: concurrent
+    # identical requests of a cached command share one in-flight request,
+    # and its response is reused for `ttls[command]` seconds (0: shared only
+    # while in flight). Commands without a TTL are never cached.
+
+    def __init__(self, ttls: dict[str, float] = None):
+        self.ttls = dict(ttls or dict())
+        # key -> (expiry, response)
+        self._values: dict[tuple, tuple] = dict()
+        # fetched by a task of the cache, cancelled by none of the callers
+        self._inflight: dict[tuple, asyncio.Task] = dict()
+        # invalidations by command, and of all commands: a response fetched
+        # across one is outdated and not cached
+        self._generations: dict[str, int] = dict()
+        self._epoch = 0
+
+    async def get(self, key: tuple, fetch: Callable[[], Awaitable]):
+        # key: the request params, the command first
+        ttl = self.ttls.get(key[0])
+        if ttl is None:
+            return await fetch()
+
+        value = self._values.get(key)
+        if value is not None and value[0] > time.monotonic():
+            RESPONSE_CACHE.labels("hit").inc()
+            return value[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            RESPONSE_CACHE.labels("coalesced").inc()
+        else:
+            RESPONSE_CACHE.labels("miss").inc()
+            task = asyncio.ensure_future(self._fetch(key, fetch, ttl))
+            # retrieved, whether requests still wait for it or not
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: tuple, fetch: Callable[[], Awaitable], ttl: float):
+        generation = self._generation(key[0])
+        try:
+            response = await fetch()
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+        if ttl > 0 and generation == self._generation(key[0]):
+            self._values[key] = (time.monotonic() + ttl, response)
+        return response
+
+    def _generation(self, command: str) -> tuple:
+        return self._epoch, self._generations.get(command, 0)
+
+    def invalidate(self, *commands: str):
+        # cached and in-flight responses of the commands, of every command by
+        # default: later requests fetch them again
+        if not commands:
+            self._epoch += 1
+            self._values.clear()
+            self._inflight.clear()
+            return
+        for command in commands:
+            self._generations[command] = self._generations.get(command, 0) + 1
+        for key in [key for key in self._values if key[0] in commands]:
+            del self._values[key]
+        for key in [key for key in self._inflight if key[0] in commands]:
+            del self._inflight[key]
@@ -1,18 +1,39 @@
 import asyncio
 import logging
 import time
+import uuid
 from typing import Callable
 
 import zmq
 import zmq.asyncio
 
+from .dispatcher import POLICY_BLOCK, SubscriptionDispatcher
+from .metrics import (
+    CLIENT_QUEUE_DEPTH,
+    CLIENT_QUEUE_SECONDS,
+    REQUEST_EXPIRED,
+    REQUEST_SECONDS,
+)
+from .sequence import SequenceTracker
+
 logger = logging.getLogger("PyMetaTrader:MT5MQClient")
 
 
 class MT5MQClient:
-    def __init__(self) -> None:
-        self._ctx = zmq.asyncio.Context()
+    def __init__(self, ctx: zmq.Context | None = None) -> None:
+        # a context shared with an in-process broker allows inproc:// urls
+        self._shared = ctx is not None
+        if self._shared:
+            self._ctx = zmq.asyncio.Context.shadow(ctx.underlying)
+        else:
+            self._ctx = zmq.asyncio.Context()
+        self._sockets: set[zmq.asyncio.Socket] = set()
+        self._tasks: set[asyncio.Task] = set()
         self._queue = asyncio.Queue(100)
+        self._sub_socket: zmq.asyncio.Socket | None = None
+        self.dispatcher: SubscriptionDispatcher | None = None
+        self.sequences: SequenceTracker | None = None
+        self._correlation = 0
 
     async def start(
         self,
@@ -20,62 +41,175 @@ class MT5MQClient:
         subscribe_url="tcp://127.0.0.1:22881",
         subscribe_callback: Callable = None,
         size=5,
+        topics: list[bytes] | None = None,
+        policy: str = POLICY_BLOCK,
+        policies: dict[str, str] | None = None,
+        queue_size=100,
+        dealer=False,
+        sequences: SequenceTracker | None = None,
     ) -> None:
         # Requester
-        for i in range(0, size):
-            await self._new_loop_request(request_url=request_url, id=i)
-        logger.info("Initialized %d request concurrencies to %s", size, request_url)
+        if dealer:
+            self._spawn(self._loop_dealer(request_url=request_url))
+            logger.info("Initialized pipelined requests to %s", request_url)
+        else:
+            for i in range(0, size):
+                await self._new_loop_request(request_url=request_url, id=i)
+            logger.info("Initialized %d request concurrencies to %s", size, request_url)
+
+        # Subscriber, filtered by topic prefixes (everything by default)
+        self._sub_socket = self._socket(zmq.SUB)
+        self._sub_socket.connect(subscribe_url)
+        for topic in [b""] if topics is None else topics:
+            self.subscribe(topic)
+        logger.info("Connecting to publisher %s", subscribe_url)
 
-        asyncio.ensure_future(
-            self._loop_subcribe(
-                subscribe_url=subscribe_url, callback=subscribe_callback
-            )
+        # SEQ numbers checked before the dispatcher drops or conflates any
+        self.sequences = sequences
+        self.dispatcher = SubscriptionDispatcher(
+            subscribe_callback, policy=policy, size=queue_size, policies=policies
         )
+        self._spawn(self._loop_subcribe())
 
     async def stop(self):
-        self._ctx.destroy()
-
-    async def request(self, *params, timeout=30) -> str:
-        expiry = time.time() + timeout
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+
+        if not self._shared:
+            self._ctx.destroy()
+            return
+        for socket in self._sockets:
+            socket.close(linger=0)
+        self._sockets.clear()
+
+    async def request(self, *params, timeout=30, raw=False) -> str | bytes:
+        enqueued = time.time()
+        expiry = enqueued + timeout
         future = asyncio.Future()
-        await self._queue.put((params, future, expiry))
-        return await future
+        await self._queue.put((params, future, expiry, enqueued))
+        CLIENT_QUEUE_DEPTH.set(self._queue.qsize())
+        response = await future
+
+        REQUEST_SECONDS.labels(_command(params)).observe(time.time() - enqueued)
+        return response if raw else response.decode()
+
+    def _socket(self, type: int) -> zmq.asyncio.Socket:
+        socket = self._ctx.socket(type)
+        self._sockets.add(socket)
+        return socket
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def subscribe(self, topic: bytes):
+        self._sub_socket.setsockopt(zmq.SUBSCRIBE, topic)
+
+    def unsubscribe(self, topic: bytes):
+        self._sub_socket.setsockopt(zmq.UNSUBSCRIBE, topic)
 
     async def _new_loop_request(self, request_url: str, id: int):
-        asyncio.ensure_future(self._loop_request(request_url=request_url, id=id))
+        self._spawn(self._loop_request(request_url=request_url, id=id))
 
     async def _loop_request(self, request_url: str, id: int):
-        ctx = zmq.asyncio.Context.instance()
-        request_socket: zmq.asyncio.Socket = ctx.socket(zmq.REQ)
+        request_socket: zmq.asyncio.Socket = self._socket(zmq.REQ)
         request_socket.setsockopt(zmq.IDENTITY, f"Client-{id}".encode())
         request_socket.connect(request_url)
         logger.info("Initialized request socket %s", request_url)
 
         while True:
-            params, future, expiry = await self._queue.get()
+            params, future, expiry, enqueued = await self._queue.get()
+            CLIENT_QUEUE_SECONDS.observe(time.time() - enqueued)
+            if _expired(future, expiry, params):
+                continue
             await request_socket.send_multipart(params)
 
             try:
                 async with asyncio.timeout(expiry - time.time()):
-                    response = await request_socket.recv_string()
+                    response = await request_socket.recv()
                     future.set_result(response)
             except asyncio.TimeoutError:
                 logger.warning("Request expired: %s", params)
-                future.set_result("KO|Request expired")
+                REQUEST_EXPIRED.inc()
+                future.set_result(b"KO|Request expired")
                 request_socket.close()
+                self._sockets.discard(request_socket)
                 await self._new_loop_request(request_url=request_url, id=id)
                 break
 
         logger.warning("Loop request %d died", id)
 
-    async def _loop_subcribe(self, subscribe_url: str, callback: Callable):
-        sub_socket = self._ctx.socket(zmq.SUB)
-        sub_socket.connect(subscribe_url)
-        sub_socket.setsockopt(zmq.SUBSCRIBE, b"")
-        logger.info("Connecting to publisher %s", subscribe_url)
+    async def _loop_dealer(self, request_url: str):
+        # Many requests in flight on one socket, replies matched by correlation id
+        request_socket: zmq.asyncio.Socket = self._socket(zmq.DEALER)
+        request_socket.setsockopt(zmq.IDENTITY, f"Client-{uuid.uuid4().hex}".encode())
+        request_socket.connect(request_url)
+        logger.info("Initialized dealer socket %s", request_url)
+
+        loop = asyncio.get_running_loop()
+        pending: dict[bytes, tuple[asyncio.Future, asyncio.TimerHandle]] = dict()
+        self._spawn(self._loop_dealer_reply(request_socket, pending))
+
+        while True:
+            params, future, expiry, enqueued = await self._queue.get()
+            CLIENT_QUEUE_SECONDS.observe(time.time() - enqueued)
+            if _expired(future, expiry, params):
+                continue
+            self._correlation += 1
+            correlation = str(self._correlation).encode()
+            timer = loop.call_later(
+                expiry - time.time(), self._expire, pending, correlation, params
+            )
+            pending[correlation] = (future, timer)
+            await request_socket.send_multipart([b"", correlation, *params])
 
+    async def _loop_dealer_reply(
+        self, request_socket: zmq.asyncio.Socket, pending: dict
+    ):
         while True:
-            msg = await sub_socket.recv()
-            asyncio.ensure_future(callback(msg))
+            _, correlation, response = await request_socket.recv_multipart()
+            future, timer = pending.pop(correlation, (None, None))
+            if future is None:
+                logger.warning("Late reply %s: %s", correlation, response[:100])
+                continue
+            timer.cancel()
+            future.set_result(response)
+
+    def _expire(self, pending: dict, correlation: bytes, params):
+        future, _ = pending.pop(correlation, (None, None))
+        if future is not None and not future.done():
+            logger.warning("Request expired: %s", params)
+            REQUEST_EXPIRED.inc()
+            future.set_result(b"KO|Request expired")
+
+    async def _loop_subcribe(self):
+        while True:
+            msg = await self._sub_socket.recv()
+            if self.sequences is not None:
+                self.sequences.observe(msg)
+            await self.dispatcher.dispatch(msg)
 
         logger.warning("Loop subscribe died")
+
+
+def _expired(future: asyncio.Future, expiry: float, params) -> bool:
+    # a request that waited out its timeout here is never sent
+    if expiry > time.time():
+        return False
+    logger.warning("Request expired: %s", params)
+    REQUEST_EXPIRED.inc()
+    future.set_result(b"KO|Request expired")
+    return True
+
+
+def _command(params) -> str:
+    # command of a request for metric labels, after an "@account;" prefix
+    fields = params[0].split(b";", 2)
+    if fields[0].startswith(b"@") and len(fields) > 1:
+        return fields[1].decode()
+    return fields[0].decode()
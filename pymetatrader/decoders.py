@@ -0,0 +1,115 @@
+import logging
+import re
+from typing import Callable
+
+logger = logging.getLogger("PyMetaTrader:Decoder")
+
+
+class RecordDecoder:
+    # Decodes a `;` separated batch of `key=value|key=value` records.
+    # MTServer always writes the fields of a message type in the same order,
+    # so the field layout of the first record is compiled once into a
+    # function that slices values by position for the whole batch.
+
+    def __init__(self, format: dict, millis: tuple = ()):
+        self.format = format
+        self.millis = set(millis)
+        self._compiled: dict[tuple, Callable] = dict()
+
+    def decode(self, data: str, output: type = dict) -> list:
+        raws = data.split(";")
+        first = next((raw for raw in raws if raw), None)
+        if first is None:
+            return []
+
+        items = first.split("|")
+        if not all("=" in item for item in items):
+            return [self._decode_record(raw, output) for raw in raws if raw]
+
+        keys = tuple(item.split("=", 1)[0] for item in items)
+        decode = self._compiled.get((keys, output))
+        if decode is None:
+            decode = self._compile(keys, output)
+            self._compiled[(keys, output)] = decode
+
+        try:
+            return decode(raws)
+        except (ValueError, IndexError):
+            # a record with another layout, e.g. `|` inside a comment
+            return [self._decode_record(raw, output) for raw in raws if raw]
+
+    def _compile(self, keys: tuple, output: type) -> Callable:
+        # every record must have the same keys in the same order: the pattern
+        # checks them while capturing the values, any other layout raises and
+        # the batch falls back to _decode_record
+        pattern = re.compile(r"\|".join(re.escape(key) + "=([^|]*)" for key in keys))
+        namespace = dict(match=pattern.fullmatch)
+        values = dict()
+        for i, key in enumerate(keys):
+            value = f"f[{i}]"
+            type = self.format.get(key, str)
+            if type is not str:
+                namespace[f"t{i}"] = type
+                value = f"t{i}({value})"
+            if key in self.millis:
+                value = f"{value} * 1000"
+            values[key] = value
+
+        if output is dict:
+            record = "{" + ", ".join(f"{k!r}: {v}" for k, v in values.items()) + "}"
+        elif output is tuple:
+            record = "(" + ", ".join(values.values()) + ",)"
+        else:
+            # record class, built positionally in the order of its fields
+            fields = getattr(output, "_fields", None) or output.__slots__
+            namespace["record"] = output
+            args = ", ".join(values.get(field, "None") for field in fields)
+            record = f"record({args})"
+
+        source = (
+            "def decode(raws):\n"
+            "    result = []\n"
+            "    append = result.append\n"
+            "    for raw in raws:\n"
+            "        if not raw:\n"
+            "            continue\n"
+            "        m = match(raw)\n"
+            "        if m is None:\n"
+            "            raise ValueError(raw)\n"
+            "        f = m.groups()\n"
+            f"        append({record})\n"
+            "    return result\n"
+        )
+        exec(source, namespace)
+        logger.debug("Compiled decoder for %s: %s", keys, record)
+        return namespace["decode"]
+
+    def _decode_record(self, raw: str, output: type):
+        items = dict()
+        key = None
+        for item in raw.split("|"):
+            if "=" not in item and key is not None:
+                items[key] += f"|{item}"
+                continue
+            key, val = item.split("=", 1)
+            items[key] = val
+
+        result = dict()
+        for key, val in items.items():
+            type = self.format.get(key, str)
+            try:
+                result[key] = type(val)
+            except ValueError as e:
+                raise RuntimeError(
+                    f"Cannot parse value {val} by key {key}, "
+                    f"type {type} for data {raw}"
+                ) from e
+            if key in self.millis:
+                result[key] = result[key] * 1000
+
+        if output is dict:
+            return result
+        if output is tuple:
+            return tuple(result.values())
+        fields = getattr(output, "_fields", None) or output.__slots__
+        return output(*(result.get(field) for field in fields))
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from typing import Callable
+
+from .metrics import SUBSCRIPTION_CONFLATED, SUBSCRIPTION_DROPPED
+from .protocol import BINARY_SUFFIX
+
+logger = logging.getLogger("PyMetaTrader:Dispatcher")
+
+POLICY_BLOCK = "block"
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_CONFLATE = "conflate"
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_CONFLATE)
+
+
+class _Topic:
+    __slots__ = (
+        "type",
+        "policy",
+        "queue",
+        "task",
+        "received",
+        "delivered",
+        "dropped",
+        "conflated",
+        "failed",
+    )
+
+    def __init__(self, type: str, policy: str, size: int):
+        self.type = type
+        self.policy = policy
+        self.queue = asyncio.Queue(1 if policy == POLICY_CONFLATE else size)
+        self.task: asyncio.Task | None = None
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.failed = 0
+
+
+class SubscriptionDispatcher:
+    # Published frames are queued per topic token (TYPE[_BIN][:SYMBOL[:TF]])
+    # and delivered to the callback by one task per topic, so frames of a
+    # topic keep their order and a slow consumer is bounded by `size`:
+    #   block:       wait for room, the SUB socket high water mark then
+    #                drops at the publisher
+    #   drop_oldest: discard the oldest queued frame of the topic
+    #   conflate:    keep only the latest frame of the topic, with TOPICS
+    #                negotiated that is the latest frame per symbol. Not for
+    #                EVENTS batches without TOPICS, which only hold the
+    #                changed symbols
+
+    def __init__(
+        self,
+        callback: Callable,
+        policy: str = POLICY_BLOCK,
+        size: int = 100,
+        policies: dict[str, str] | None = None,
+    ):
+        for p in [policy, *(policies or dict()).values()]:
+            if p not in POLICIES:
+                raise RuntimeError(f"Unknown dispatch policy: {p}")
+
+        self.callback = callback
+        self.policy = policy
+        self.size = size
+        # policy by message type, e.g. dict(TICKS="conflate", REFRESH="block")
+        self.policies = dict(policies or dict())
+        self._topics: dict[bytes, _Topic] = dict()
+
+    async def dispatch(self, msg: bytes):
+        token = msg.split(b" ", 1)[0]
+        topic = self._topics.get(token)
+        if topic is None:
+            topic = self._new_topic(token)
+
+        topic.received += 1
+        queue = topic.queue
+        if topic.policy == POLICY_BLOCK:
+            await queue.put(msg)
+            return
+
+        if queue.full():
+            queue.get_nowait()
+            queue.task_done()
+            if topic.policy == POLICY_CONFLATE:
+                topic.conflated += 1
+                SUBSCRIPTION_CONFLATED.labels(topic.type).inc()
+            else:
+                topic.dropped += 1
+                SUBSCRIPTION_DROPPED.labels(topic.type).inc()
+        queue.put_nowait(msg)
+
+    def policy_of(self, type: str) -> str:
+        return self.policies.get(type, self.policy)
+
+    def set_policy(self, type: str, policy: str):
+        # policy of a message type, also for its topics already received
+        if policy not in POLICIES:
+            raise RuntimeError(f"Unknown dispatch policy: {policy}")
+        self.policies[type] = policy
+        for topic in self._topics.values():
+            if topic.type == type:
+                topic.policy = policy
+
+    def _new_topic(self, token: bytes) -> _Topic:
+        type = token.decode().split(":", 1)[0]
+        if type.endswith(BINARY_SUFFIX):
+            type = type[: -len(BINARY_SUFFIX)]
+
+        topic = _Topic(type, self.policy_of(type), self.size)
+        topic.task = asyncio.ensure_future(self._loop_topic(token, topic))
+        self._topics[token] = topic
+        return topic
+
+    async def _loop_topic(self, token: bytes, topic: _Topic):
+        queue = topic.queue
+        while True:
+            msg = await queue.get()
+            try:
+                await self.callback(msg)
+                topic.delivered += 1
+            except Exception:
+                topic.failed += 1
+                logger.exception("Subscription callback failed for %s", token)
+            finally:
+                queue.task_done()
+
+    def stats(self) -> dict[str, dict]:
+        return {
+            token.decode(): dict(
+                policy=topic.policy,
+                queued=topic.queue.qsize(),
+                received=topic.received,
+                delivered=topic.delivered,
+                dropped=topic.dropped,
+                conflated=topic.conflated,
+                failed=topic.failed,
+            )
+            for token, topic in self._topics.items()
+        }
+
+    def stop(self):
+        for topic in self._topics.values():
+            topic.task.cancel()
+        self._topics.clear()
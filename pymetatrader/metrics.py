@@ -0,0 +1,283 @@
+import asyncio
+import bisect
+import logging
+import math
+import threading
+
+logger = logging.getLogger("PyMetaTrader:Metrics")
+
+# Seconds, from an inproc hop to a slow history request
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children: dict[tuple, "_Metric"] = dict()
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs) -> "_Metric":
+        key = values or tuple(str(kwargs[name]) for name in self.label_names)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self) -> "_Metric":
+        return type(self)(self.name, self.help)
+
+    def _samples(self, labels: dict):
+        raise NotImplementedError()
+
+    def samples(self):
+        # -> (name, labels, value)
+        if not self.label_names:
+            yield from self._samples(dict())
+            return
+        for key, child in list(self._children.items()):
+            yield from child._samples(dict(zip(self.label_names, key)))
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def _samples(self, labels: dict):
+        yield f"{self.name}_total", labels, self.value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def _samples(self, labels: dict):
+        yield self.name, labels, self.value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labels: tuple = (), buckets=LATENCY_BUCKETS
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def _samples(self, labels: dict):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            le = "+Inf" if bound is math.inf else repr(float(bound))
+            yield f"{self.name}_bucket", dict(labels, le=le), cumulative
+        yield f"{self.name}_sum", labels, self.sum
+        yield f"{self.name}_count", labels, self.count
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = dict()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(
+        self, name: str, help: str, labels: tuple = (), buckets=LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def collect(self):
+        # -> (metric, [(name, labels, value)]), for exporters
+        for metric in list(self._metrics.values()):
+            yield metric, list(metric.samples())
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        lines = []
+        for metric, samples in self.collect():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                if labels:
+                    text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                    name = f"{name}{{{text}}}"
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusExporter:
+    # Minimal HTTP endpoint answering every GET with the registry text
+
+    def __init__(self, registry: "MetricsRegistry" = None):
+        self.registry = registry or REGISTRY
+        self._server: asyncio.Server | None = None
+
+    async def start(self, host="127.0.0.1", port=9880):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        logger.info("Serving metrics on http://%s:%d/metrics", host, port)
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # request line and headers are not needed
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            body = self.registry.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+REGISTRY = MetricsRegistry()
+
+# Client
+CLIENT_QUEUE_DEPTH = REGISTRY.gauge(
+    "pymetatrader_client_queue_depth", "Requests waiting for a client socket"
+)
+CLIENT_QUEUE_SECONDS = REGISTRY.histogram(
+    "pymetatrader_client_queue_seconds", "Time from request enqueue to send"
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "pymetatrader_request_seconds",
+    "Time from request enqueue to reply",
+    labels=("command",),
+)
+REQUEST_EXPIRED = REGISTRY.counter(
+    "pymetatrader_request_expired", "Requests without reply before their timeout"
+)
+RESPONSE_CACHE = REGISTRY.counter(
+    "pymetatrader_response_cache",
+    "Cacheable requests by result: hit, coalesced or miss",
+    labels=("result",),
+)
+
+# Broker
+BROKER_QUEUE_DEPTH = REGISTRY.gauge(
+    "pymetatrader_broker_queue_depth",
+    "Requests waiting for a worker",
+    labels=("priority",),
+)
+BROKER_QUEUE_SECONDS = REGISTRY.histogram(
+    "pymetatrader_broker_queue_seconds",
+    "Time from broker receive to worker dispatch",
+    labels=("priority",),
+)
+BROKER_EXPIRED = REGISTRY.counter(
+    "pymetatrader_broker_expired", "Requests expired in the broker queues"
+)
+BROKER_REJECTED = REGISTRY.counter(
+    "pymetatrader_broker_rejected", "Requests rejected by a full broker queue"
+)
+WORKER_SECONDS = REGISTRY.histogram(
+    "pymetatrader_worker_seconds", "Time from worker dispatch to worker reply"
+)
+WORKERS = REGISTRY.gauge("pymetatrader_workers", "Connected workers", labels=("state",))
+
+# Subscriptions
+PARSE_SECONDS = REGISTRY.histogram(
+    "pymetatrader_parse_seconds", "Time to parse a publication", labels=("type",)
+)
+MESSAGE_AGE_SECONDS = REGISTRY.histogram(
+    "pymetatrader_message_age_seconds",
+    "Receive time minus terminal time of a publication",
+    labels=("type",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+SUBSCRIPTION_DROPPED = REGISTRY.counter(
+    "pymetatrader_subscription_dropped",
+    "Publications dropped by a full subscription queue",
+    labels=("type",),
+)
+SUBSCRIPTION_CONFLATED = REGISTRY.counter(
+    "pymetatrader_subscription_conflated",
+    "Publications replaced by a newer one of the same topic",
+    labels=("type",),
+)
+SUBSCRIPTION_MISSED = REGISTRY.counter(
+    "pymetatrader_subscription_missed",
+    "Publications missed before a received one, by their SEQ numbers",
+    labels=("type",),
+)
+SUBSCRIPTION_RESYNCS = REGISTRY.counter(
+    "pymetatrader_subscription_resyncs",
+    "State re-fetched after missed publications",
+    labels=("type",),
+)
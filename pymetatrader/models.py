@@ -0,0 +1,117 @@
+from collections.abc import Mapping
+
+
+class Record(Mapping):
+    # Slotted record with a read/write dict view, so code written against
+    # the dict results keeps working: record["bid"], dict(record), ==.
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # positional/keyword __init__ generated once per record type
+        fields = cls.__slots__
+        args = ", ".join(f"{field}=None" for field in fields)
+        body = "".join(f"    self.{field} = {field}\n" for field in fields)
+        namespace = dict()
+        exec(f"def __init__(self, {args}):\n{body}", namespace)
+        cls.__init__ = namespace["__init__"]
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __repr__(self):
+        values = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class Quote(Record):
+    __slots__ = (
+        "symbol",
+        "open",
+        "high",
+        "low",
+        "close",
+        "volume",
+        "bid",
+        "ask",
+        "last",
+        "spread",
+        "prev_close",
+        "change",
+        "change_percent",
+    )
+
+
+class Tick(Record):
+    __slots__ = ("symbol", "bid", "ask", "spread", "at")
+
+
+class Trade(Record):
+    __slots__ = (
+        "ticket",
+        "symbol",
+        "type",
+        "open_price",
+        "open_time",
+        "lots",
+        "sl",
+        "tp",
+        "pnl",
+        "swap",
+        "comment",
+    )
+
+
+class Order(Record):
+    __slots__ = (
+        "ticket",
+        "position",
+        "symbol",
+        "state",
+        "type",
+        "open_price",
+        "open_time",
+        "close_time",
+        "lots",
+        "sl",
+        "tp",
+        "expiration",
+        "comment",
+    )
+
+
+class Deal(Record):
+    __slots__ = (
+        "ticket",
+        "order",
+        "position",
+        "symbol",
+        "type",
+        "entry",
+        "price",
+        "time",
+        "lots",
+        "sl",
+        "tp",
+        "commission",
+        "swap",
+        "pnl",
+        "comment",
+    )
@@ -0,0 +1,106 @@
+import numpy as np
+
+from .bars import BAR_DTYPE, BAR_FIELDS, empty_bars
+
+# Packed little-endian records published by MTServer once the BINARY
+# feature is negotiated, see `MTServer::processRequestProtocol`.
+SYMBOL_SIZE = 32
+TIMEFRAME_SIZE = 8
+
+TICK_DTYPE = np.dtype(
+    [
+        ("symbol", f"S{SYMBOL_SIZE}"),
+        ("bid", "<f8"),
+        ("ask", "<f8"),
+        ("spread", "<f8"),
+        ("at", "<f8"),
+    ]
+)
+
+QUOTE_DTYPE = np.dtype(
+    [
+        ("symbol", f"S{SYMBOL_SIZE}"),
+        ("open", "<f8"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("close", "<f8"),
+        ("volume", "<f8"),
+        ("bid", "<f8"),
+        ("ask", "<f8"),
+        ("last", "<f8"),
+        ("spread", "<f8"),
+        ("prev_close", "<f8"),
+        ("change", "<f8"),
+        ("change_percent", "<f8"),
+    ]
+)
+
+BAR_UPDATE_DTYPE = np.dtype(
+    [
+        ("symbol", f"S{SYMBOL_SIZE}"),
+        ("timeframe", f"S{TIMEFRAME_SIZE}"),
+    ]
+    + [(field, "<f8") for field in BAR_FIELDS]
+)
+
+BINARY_SUFFIX = "_BIN"
+
+# "#<number> " after the topic of the publications numbered by topic once
+# the SEQ feature is negotiated
+SEQUENCE_PREFIX = b"#"
+
+
+def split_sequence(payload: bytes) -> tuple[int | None, bytes]:
+    # -> (publication number or None, payload without it)
+    if payload[:1] != SEQUENCE_PREFIX:
+        return None, payload
+    number, _, rest = payload[1:].partition(b" ")
+    if not number.isdigit():
+        # not numbered, e.g. the bars of a "#AAPL" symbol
+        return None, payload
+    return int(number), rest
+
+
+def decode_bars(payload: bytes) -> tuple[np.ndarray, bool]:
+    # 1 byte building status followed by BAR_DTYPE records
+    if not payload:
+        return empty_bars(), False
+
+    building = payload[:1] == b"\x01"
+    bars = _frombuffer(payload, BAR_DTYPE, offset=1).copy()
+    bars["time"] *= 1000
+    return bars, building
+
+
+def decode_bar_updates(payload: bytes) -> list[tuple]:
+    records = _frombuffer(payload, BAR_UPDATE_DTYPE)
+    result = []
+    for symbol, timeframe, time, *bar in records.tolist():
+        result.append((symbol.decode(), timeframe.decode(), [time * 1000] + bar))
+    return result
+
+
+def decode_ticks(payload: bytes, output: type = dict) -> list:
+    return _decode_records(payload, TICK_DTYPE, output)
+
+
+def decode_quotes(payload: bytes, output: type = dict) -> list:
+    return _decode_records(payload, QUOTE_DTYPE, output)
+
+
+def _decode_records(payload: bytes, dtype: np.dtype, output: type) -> list:
+    names = dtype.names
+    result = []
+    for record in _frombuffer(payload, dtype).tolist():
+        record = dict(zip(names, record))
+        record["symbol"] = record["symbol"].decode()
+        result.append(record if output is dict else output(**record))
+    return result
+
+
+def _frombuffer(payload: bytes, dtype: np.dtype, offset=0) -> np.ndarray:
+    if (len(payload) - offset) % dtype.itemsize:
+        raise RuntimeError(
+            f"Cannot decode {len(payload)} bytes as {dtype.itemsize} bytes records"
+        )
+    return np.frombuffer(payload, dtype=dtype, offset=offset)
@@ -0,0 +1,288 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Iterable, Mapping
+
+import numpy as np
+
+from .protocol import QUOTE_DTYPE, TICK_DTYPE
+
+logger = logging.getLogger("PyMetaTrader:Recorder")
+
+# Segment file: MAGIC, version, header size, json header, compressed columns
+MAGIC = b"PMTS"
+VERSION = 1
+_PREFIX = struct.Struct("<4sBI")
+SEGMENT_EXT = ".seg"
+
+# columns of a recorded type, after the receive time of each record
+RECORD_FIELDS = dict(
+    TICKS=tuple(f for f in TICK_DTYPE.names if f != "symbol"),
+    QUOTES=tuple(f for f in QUOTE_DTYPE.names if f != "symbol"),
+)
+RECORD_DTYPES = {
+    type: np.dtype([("received", "<f8")] + [(field, "<f8") for field in fields])
+    for type, fields in RECORD_FIELDS.items()
+}
+
+# decimals tried for the fixed point encoding of a column, microseconds for
+# receive times, fractional pips for prices
+MAX_DECIMALS = 6
+
+
+class TickRecorder:
+    # Records TICKS/QUOTES publications: a `subscribe_callback` buffering the
+    # records of each symbol and writing them as compressed columnar segments
+    # under <path>/<TYPE>/<SYMBOL>/<YYYYMMDD>/<first receive time>.seg.
+    # Numeric columns are stored as fixed point deltas, byte shuffled and
+    # zlib compressed; segments rotate every `segment_size` records,
+    # `flush_interval` seconds and UTC day.
+
+    def __init__(
+        self,
+        path: str,
+        types: Iterable[str] = ("TICKS", "QUOTES"),
+        segment_size=100000,
+        flush_interval=60.0,
+        level=6,
+    ):
+        for type in types:
+            if type not in RECORD_FIELDS:
+                raise RuntimeError(f"Cannot record {type}")
+
+        self.path = path
+        self.types = set(types)
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.level = level
+        self.recorded = 0
+        # (type, symbol) -> rows, first receive time
+        self._buffers: dict[tuple, list] = dict()
+        self._started: dict[tuple, float] = dict()
+        self._writes: set[asyncio.Future] = set()
+
+    async def record(self, type: str, data: list[Mapping]):
+        if type not in self.types:
+            return
+
+        received = round(time.time(), MAX_DECIMALS)
+        fields = RECORD_FIELDS[type]
+        for record in data:
+            key = (type, record["symbol"])
+            rows = self._buffers.get(key)
+            if rows is None:
+                rows = self._buffers[key] = []
+                self._started[key] = received
+            rows.append((received, *(record[field] for field in fields)))
+
+            if len(rows) >= self.segment_size:
+                self._flush(key)
+        self.recorded += len(data)
+
+        # rotate quiet symbols and segments spanning a day change
+        for key, started in list(self._started.items()):
+            if (
+                received - started >= self.flush_interval
+                or received // 86400 != started // 86400
+            ):
+                self._flush(key)
+
+    async def flush(self):
+        for key in list(self._buffers):
+            self._flush(key)
+        if self._writes:
+            await asyncio.gather(*self._writes)
+
+    async def close(self):
+        await self.flush()
+
+    def _flush(self, key: tuple):
+        rows = self._buffers.pop(key, None)
+        self._started.pop(key, None)
+        if not rows:
+            return
+
+        type, symbol = key
+        records = np.array(rows, dtype=RECORD_DTYPES[type])
+        loop = asyncio.get_running_loop()
+        write = loop.run_in_executor(None, self._write, type, symbol, records)
+        self._writes.add(write)
+        write.add_done_callback(self._written)
+
+    def _written(self, write: asyncio.Future):
+        self._writes.discard(write)
+        if not write.cancelled() and write.exception() is not None:
+            logger.error("Cannot write segment", exc_info=write.exception())
+
+    def _write(self, type: str, symbol: str, records: np.ndarray):
+        start = records["received"][0]
+        day = time.strftime("%Y%m%d", time.gmtime(start))
+        folder = os.path.join(self.path, type, symbol, day)
+        os.makedirs(folder, exist_ok=True)
+
+        file = os.path.join(folder, f"{int(start * 1e6)}{SEGMENT_EXT}")
+        if os.path.exists(file):
+            # two flushes within the same microsecond
+            file = file.replace(
+                SEGMENT_EXT, f"-{os.getpid()}-{id(records)}{SEGMENT_EXT}"
+            )
+
+        tmp = f"{file}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(encode_segment(type, symbol, records, self.level))
+        os.replace(tmp, file)
+        logger.debug("Recorded %d %s of %s in %s", len(records), type, symbol, file)
+
+
+class TickReader:
+    # Reads the segments of a TickRecorder. Segment files are memory mapped
+    # and only the columns of the segments overlapping the asked range are
+    # decompressed.
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def types(self) -> list[str]:
+        return _folders(self.path)
+
+    def symbols(self, type: str) -> list[str]:
+        return _folders(os.path.join(self.path, type))
+
+    def segments(self, type: str, symbol: str, start=None, end=None) -> list[str]:
+        # segment files in receive time order, overlapping [start, end]
+        folder = os.path.join(self.path, type, symbol)
+        files = []
+        for day in _folders(folder):
+            for name in os.listdir(os.path.join(folder, day)):
+                if name.endswith(SEGMENT_EXT):
+                    files.append(os.path.join(folder, day, name))
+        files.sort(key=_segment_start)
+
+        if start is None and end is None:
+            return files
+        result = []
+        for file in files:
+            header = read_header(file)
+            if start is not None and header["end"] < start:
+                continue
+            if end is not None and header["start"] > end:
+                break
+            result.append(file)
+        return result
+
+    def read(self, type: str, symbol: str, start=None, end=None) -> np.ndarray:
+        chunks = [
+            read_segment(file)
+            for file in self.segments(type, symbol, start=start, end=end)
+        ]
+        if not chunks:
+            return np.empty(0, dtype=RECORD_DTYPES[type])
+
+        records = np.concatenate(chunks)
+        received = records["received"]
+        lo = 0 if start is None else np.searchsorted(received, start, "left")
+        hi = len(records) if end is None else np.searchsorted(received, end, "right")
+        return records[lo:hi]
+
+
+def encode_segment(type: str, symbol: str, records: np.ndarray, level=6) -> bytes:
+    columns = []
+    blobs = []
+    for name in records.dtype.names:
+        column, blob = _encode_column(records[name], level)
+        column["name"] = name
+        column["size"] = len(blob)
+        columns.append(column)
+        blobs.append(blob)
+
+    header = json.dumps(
+        dict(
+            type=type,
+            symbol=symbol,
+            count=len(records),
+            start=float(records["received"][0]),
+            end=float(records["received"][-1]),
+            columns=columns,
+        )
+    ).encode()
+    return b"".join([_PREFIX.pack(MAGIC, VERSION, len(header)), header, *blobs])
+
+
+def read_header(file: str) -> dict:
+    with open(file, "rb") as f:
+        header, _ = _parse_header(f.read)
+    return header
+
+
+def read_segment(file: str) -> np.ndarray:
+    with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        header, offset = _parse_header(m.read)
+        records = np.empty(header["count"], dtype=RECORD_DTYPES[header["type"]])
+        with memoryview(m) as view:
+            for column in header["columns"]:
+                with view[offset : offset + column["size"]] as blob:
+                    values = _decode_column(column, blob, len(records))
+                records[column["name"]] = values
+                offset += column["size"]
+    return records
+
+
+def _parse_header(read) -> tuple[dict, int]:
+    magic, version, size = _PREFIX.unpack(read(_PREFIX.size))
+    if magic != MAGIC or version != VERSION:
+        raise RuntimeError(f"Not a recorder segment: {magic} v{version}")
+    return json.loads(read(size)), _PREFIX.size + size
+
+
+def _encode_column(values: np.ndarray, level: int) -> tuple[dict, bytes]:
+    # fixed point deltas of the fewest decimals representing every value
+    # exactly, raw float64 otherwise (NaN, more decimals, huge values)
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    if len(values) and np.isfinite(values).all():
+        for decimals in range(MAX_DECIMALS + 1):
+            scaled = np.round(values * 10**decimals)
+            if np.abs(scaled).max() >= 2**53:
+                break
+            if np.array_equal(scaled / 10**decimals, values):
+                deltas = np.diff(scaled.astype(np.int64), prepend=0)
+                blob = zlib.compress(_shuffle(deltas), level)
+                return dict(encoding="delta", decimals=decimals), blob
+
+    return dict(encoding="raw"), zlib.compress(_shuffle(values), level)
+
+
+def _decode_column(column: dict, blob, count: int) -> np.ndarray:
+    data = zlib.decompress(blob)
+    if column["encoding"] == "raw":
+        return _unshuffle(data, np.float64, count)
+
+    values = np.cumsum(_unshuffle(data, np.int64, count))
+    return values / 10 ** column["decimals"]
+
+
+def _shuffle(values: np.ndarray) -> bytes:
+    # byte planes, so the constant high bytes of small deltas compress away
+    return values.view(np.uint8).reshape(-1, values.itemsize).T.tobytes()
+
+
+def _unshuffle(data: bytes, dtype, count: int) -> np.ndarray:
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(-1, count)
+    return np.ascontiguousarray(planes.T).view(dtype).reshape(count)
+
+
+def _segment_start(file: str) -> int:
+    return int(os.path.basename(file).split(SEGMENT_EXT)[0].split("-")[0])
+
+
+def _folders(path: str) -> list[str]:
+    try:
+        return sorted(
+            name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name))
+        )
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import logging
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+
+from .bars import timeframe_seconds
+from .models import Quote, Tick
+from .recorder import RECORD_FIELDS, TickReader
+from .store import BarStore
+
+logger = logging.getLogger("PyMetaTrader:Replay")
+
+RECORD_TYPES = dict(TICKS=Tick, QUOTES=Quote)
+
+
+class Replayer:
+    # Stands in for the subscription of MetaTrader.start: pushes recorded
+    # TICKS/QUOTES, stored BARS and given events (e.g. REFRESH) to the same
+    # `subscribe_callback(type, data)`, merged in time order.
+    #   speed=None: as fast as possible, batches of up to `batch_size`
+    #               records of a type
+    #   speed=1.0:  real time, speed=10: ten times faster
+    # Records replay as dicts, Tick/Quote with `records`, or numpy arrays
+    # (RECORD_DTYPES plus symbol) with `as_array`, the fastest.
+
+    def __init__(
+        self,
+        callback: Callable,
+        speed: float | None = None,
+        records=False,
+        as_array=False,
+        batch_size=10000,
+    ):
+        self.callback = callback
+        self.speed = speed
+        self.records = records
+        self.as_array = as_array
+        self.batch_size = batch_size
+        self.delivered = 0
+        self._sources: list[Iterable] = []
+        self._stopped = False
+
+    def add_recording(
+        self,
+        reader: TickReader,
+        types: Iterable[str] = None,
+        symbols: Iterable[str] = None,
+        start=None,
+        end=None,
+    ):
+        # records received within [start, end], in seconds
+        self._sources.append(self._recording(reader, types, symbols, start, end))
+
+    def add_bars(
+        self, store: BarStore, symbol: str, timeframe: str, start=None, end=None
+    ):
+        # closed bars opened within [start, end], in seconds like every replay
+        # time, published at their close time
+        self._sources.append(self._bars(store, symbol, timeframe, start, end))
+
+    def add_events(self, events: Iterable[tuple]):
+        # (time in seconds, type, data) in time order, data as parsed by
+        # MetaTrader, e.g. (t, "REFRESH", dict(trades=[...], ...))
+        self._sources.append(iter(events))
+
+    def stop(self):
+        self._stopped = True
+
+    async def run(self) -> int:
+        self._stopped = False
+        events = heapq.merge(*self._sources, key=lambda event: event[0])
+        self._sources = []
+
+        loop = asyncio.get_running_loop()
+        first = None
+        started = loop.time()
+        for at, type, data in events:
+            if self._stopped:
+                break
+
+            if self.speed:
+                if first is None:
+                    first = at
+                delay = started + (at - first) / self.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            await self.callback(type, data)
+            self.delivered += len(data) if isinstance(data, (list, np.ndarray)) else 1
+        return self.delivered
+
+    def _recording(self, reader, types, symbols, start, end) -> Iterator[tuple]:
+        # every symbol of every type merged by receive time, in batches of the
+        # records received together (one publication) or of `batch_size`
+        tables = dict()
+        for type in types or RECORD_FIELDS:
+            names = symbols or reader.symbols(type)
+            width = max((len(symbol) for symbol in names), default=1)
+            parts = [
+                _with_symbol(reader.read(type, symbol, start, end), symbol, width)
+                for symbol in names
+            ]
+            parts = [part for part in parts if len(part)]
+            if not parts:
+                continue
+            table = np.concatenate(parts)
+            if len(parts) > 1:
+                table = table[np.argsort(table["received"], kind="stable")]
+            tables[type] = table
+        if not tables:
+            return
+
+        types = list(tables)
+        received = np.concatenate([table["received"] for table in tables.values()])
+        type_ids = np.concatenate(
+            [np.full(len(table), i) for i, table in enumerate(tables.values())]
+        )
+        order = np.argsort(received, kind="stable")
+        received = received[order]
+        type_ids = type_ids[order]
+
+        # row of every merged record in the (sorted) table of its type
+        rows = np.empty(len(order), dtype=np.int64)
+        for i, table in enumerate(tables.values()):
+            rows[type_ids == i] = np.arange(len(table))
+
+        # batch bounds: type changes, and receive time changes unless
+        # replaying as fast as possible
+        split = type_ids[1:] != type_ids[:-1]
+        if self.speed:
+            split |= received[1:] != received[:-1]
+        bounds = np.concatenate([[0], np.flatnonzero(split) + 1, [len(order)]])
+
+        for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            type = types[type_ids[lo]]
+            table = tables[type]
+            for at in range(lo, hi, self.batch_size):
+                row = rows[at]
+                size = min(hi - at, self.batch_size)
+                batch = table[row : row + size]
+                yield received[at], type, self._batch(type, batch)
+
+    def _batch(self, type: str, batch: np.ndarray):
+        if self.as_array:
+            return batch
+
+        fields = ("symbol", *RECORD_FIELDS[type])
+        values = batch[list(fields)].tolist()
+        if self.records:
+            record = RECORD_TYPES[type]
+            return [record(*value) for value in values]
+        return [dict(zip(fields, value)) for value in values]
+
+    def _bars(self, store, symbol, timeframe, start, end) -> Iterator[tuple]:
+        seconds = timeframe_seconds(timeframe)
+        # the store keeps bar times in milliseconds
+        start = None if start is None else start * 1000
+        end = None if end is None else end * 1000
+        for bar in store.read(symbol, timeframe, start, end).tolist():
+            yield bar[0] / 1000 + seconds, "BARS", [(symbol, timeframe, list(bar))]
+
+
+def _with_symbol(records: np.ndarray, symbol: str, width: int) -> np.ndarray:
+    dtype = np.dtype([("symbol", f"U{width}")] + records.dtype.descr)
+    result = np.empty(len(records), dtype=dtype)
+    result["symbol"] = symbol
+    for name in records.dtype.names:
+        result[name] = records[name]
+    return result
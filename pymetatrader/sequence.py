@@ -0,0 +1,78 @@
+import logging
+
+from .metrics import SUBSCRIPTION_MISSED
+from .protocol import BINARY_SUFFIX, SEQUENCE_PREFIX, split_sequence
+
+logger = logging.getLogger("PyMetaTrader:Sequence")
+
+
+class SequenceTracker:
+    # Last publication number of every topic, counted from 1 by MTServer
+    # once SEQ is negotiated. `check` returns the number of publications
+    # missed before a new one: dropped at a high water mark, or lost while
+    # the terminal restarted (numbers starting over from 1, counted as one).
+    # `observe` checks the publications as received, before the client drops
+    # or conflates any, and keeps their gaps until `take` of the next one
+    # delivered.
+
+    def __init__(self):
+        self._last: dict[str, int] = dict()
+        # missed publications by topic
+        self.missed: dict[str, int] = dict()
+        # missed publications not yet taken by a delivered one, by topic
+        self._pending: dict[str, int] = dict()
+
+    def observe(self, msg: bytes):
+        # TOPIC #<number> payload, without copying the payload
+        space = msg.find(b" ")
+        if space < 0 or msg[space + 1 : space + 2] != SEQUENCE_PREFIX:
+            return
+        end = msg.find(b" ", space + 1)
+        seq, _ = split_sequence(msg[space + 1 : None if end < 0 else end])
+        if seq is None:
+            return
+
+        topic = msg[:space].decode()
+        missed = self.check(topic, seq)
+        if missed:
+            self._pending[topic] = self._pending.get(topic, 0) + missed
+
+    def take(self, topic: str) -> int:
+        # publications missed before the delivered one of a topic
+        return self._pending.pop(topic, 0)
+
+    def check(self, topic: str, seq: int) -> int:
+        last = self._last.get(topic)
+        if last is None or seq == last + 1:
+            # the first one received, or the next one
+            self._last[topic] = seq
+            return 0
+
+        if seq <= last:
+            if seq != 1:
+                # repeated or reordered, its state is already known
+                return 0
+            missed = 1
+        else:
+            missed = seq - last - 1
+        self._last[topic] = seq
+
+        self.missed[topic] = self.missed.get(topic, 0) + missed
+        SUBSCRIPTION_MISSED.labels(_type(topic)).inc(missed)
+        logger.warning("Missed %d publications of %s before #%d", missed, topic, seq)
+        return missed
+
+    def forget(self, topic: str = ""):
+        # a topic and its sub topics (all by default) no longer received, e.g.
+        # unsubscribed: their numbers went on
+        for t in list(self._last):
+            if not topic or t == topic or t.startswith(topic + ":"):
+                del self._last[t]
+                self._pending.pop(t, None)
+
+
+def _type(topic: str) -> str:
+    type = topic.split(":", 1)[0]
+    if type.endswith(BINARY_SUFFIX):
+        type = type[: -len(BINARY_SUFFIX)]
+    return type
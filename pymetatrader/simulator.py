@@ -0,0 +1,688 @@
+import logging
+import threading
+import time
+import zlib
+
+import numpy as np
+import zmq
+
+from .bars import BAR_DTYPE, timeframe_seconds
+from .protocol import BAR_UPDATE_DTYPE, BINARY_SUFFIX, QUOTE_DTYPE, TICK_DTYPE
+
+logger = logging.getLogger("PyMetaTrader:Simulator")
+
+SYMBOLS = ("EURUSD", "GBPUSD", "USDJPY", "XAUUSD")
+# bars of one BARS/BARS_BIN reply at most, like a terminal history limit
+MAX_BARS = 100000
+MARKET_TYPES = ("BUY_MARKET", "SELL_MARKET")
+# operations of a BATCH request, like MTServer
+BATCH_COMMANDS = (
+    "OPEN_ORDER",
+    "MODIFY_ORDER",
+    "CANCEL_ORDER",
+    "MODIFY_TRADE",
+    "CLOSE_TRADE",
+)
+# fields written with %f by MTServer, all others numbers with %g
+TIME_FIELDS = ("time", "open_time", "close_time", "expiration", "at")
+
+
+class _Market:
+    __slots__ = ("symbol", "digits", "point", "bid", "open", "high", "low", "volume")
+
+    def __init__(self, symbol: str, price: float, digits: int):
+        self.symbol = symbol
+        self.digits = digits
+        self.point = 10**-digits
+        self.bid = price
+        self.open = self.high = self.low = price
+        self.volume = 0.0
+
+    @property
+    def ask(self) -> float:
+        return round(self.bid + 2 * self.point, self.digits)
+
+    def move(self, rng: np.random.Generator):
+        self.bid = round(self.bid + rng.normal(0, 5) * self.point, self.digits)
+        self.high = max(self.high, self.bid)
+        self.low = min(self.low, self.bid)
+        self.volume += 1
+
+
+class MTServerSimulator:
+    # Python stand-in for the MQL MTServer expert, for benchmarks and tests
+    # without a terminal: READY/CLOSE on the request socket, `OK|`/`KO|`
+    # replies in the MTServer text and binary formats, and synthetic
+    # BARS/QUOTES/TICKS/REFRESH publications every `publish_interval`.
+    # Prices are a random walk, history bars are generated on request.
+    # With `capacity` > 1 it is a DEALER worker taking that many requests at
+    # once, drained back to back. Only a random `activity` share of the
+    # symbols ticks every interval, all of them are published unless EVENTS
+    # is negotiated.
+
+    def __init__(
+        self,
+        request_url="tcp://127.0.0.1:22990",
+        publish_url="tcp://127.0.0.1:22991",
+        account: int = 1000,
+        symbols: tuple = SYMBOLS,
+        publish_interval=0.1,
+        delay=0.0,
+        seed: int = None,
+        ctx: zmq.Context | None = None,
+        capacity=1,
+        activity=1.0,
+    ):
+        self.request_url = request_url
+        self.publish_url = publish_url
+        self.account = account
+        self.publish_interval = publish_interval
+        # seconds spent on every request, like a busy terminal
+        self.delay = delay
+        self.capacity = capacity
+        self.activity = activity
+        self.binary = False
+        self.topics = False
+        self.delta = False
+        self.events = False
+        self.sequence = False
+        self.served = 0
+        self.published = 0
+
+        self._rng = np.random.default_rng(seed)
+        self._seed = seed or 0
+        self.markets = {
+            symbol: _Market(symbol, 1 + i * 0.25, 3 if "JPY" in symbol else 5)
+            for i, symbol in enumerate(symbols)
+        }
+        self._bar_subscribers: set[tuple] = set()
+        self._quote_subscribers: set[str] = set()
+        self._tick_subscribers: set[str] = set()
+        # tick count of the markets at their last publication by type and key
+        # with EVENTS, publications by topic with SEQ
+        self._ticked: dict[tuple, float] = dict()
+        self._sequences: dict[str, int] = dict()
+
+        self._ticket = 1000
+        self._orders: dict[int, dict] = dict()
+        self._trades: dict[int, dict] = dict()
+        self._history_orders: list[dict] = []
+        self._history_deals: list[dict] = []
+        self._refresh = False
+        # REFRESH_DELTA sequence, published records by "O<ticket>"/"T<ticket>"
+        # and history already published
+        self._seq = 0
+        self._published: dict[str, str] = dict()
+        self._history_published = (0, 0)
+
+        self._ctx = ctx or zmq.Context.instance()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _serve(self):
+        dealer = self.capacity > 1
+        request_socket = self._ctx.socket(zmq.DEALER if dealer else zmq.REQ)
+        if not dealer:
+            # CLOSE is sent while a request may be awaited
+            request_socket.setsockopt(zmq.REQ_RELAXED, 1)
+        request_socket.connect(self.request_url)
+        publish_socket = self._ctx.socket(zmq.PUB)
+        publish_socket.connect(self.publish_url)
+
+        # the envelope delimiter a REQ socket adds and strips
+        envelope = [b""] if dealer else []
+        ready = f"READY;{self.account}"
+        if dealer:
+            ready += f";{self.capacity}"
+        request_socket.send_multipart(envelope + [ready.encode()])
+        logger.info("Simulated MTServer %s connected", self.account)
+
+        publish_at = time.time() + self.publish_interval
+        try:
+            while not self._stop.is_set():
+                timeout = max(0, publish_at - time.time())
+                if request_socket.poll(min(timeout, 0.1) * 1000):
+                    # every queued request, like MTServer within a timer tick
+                    while request_socket.poll(0):
+                        frames = request_socket.recv_multipart()[len(envelope) :]
+                        request_socket.send_multipart(envelope + self._process(frames))
+
+                if time.time() >= publish_at:
+                    self._publish(publish_socket)
+                    publish_at = time.time() + self.publish_interval
+
+            request_socket.send_multipart(envelope + [b"CLOSE"])
+        finally:
+            request_socket.close(linger=100)
+            publish_socket.close(linger=0)
+
+    # ----- REQUESTS -----
+    def _process(self, frames: list) -> list:
+        # broker pings come without the client address, MTServer echoes PING
+        if len(frames) < 3:
+            return [b"PING", b"", b"OK|PONG"]
+
+        address, empty, message = frames
+        if self.delay:
+            time.sleep(self.delay)
+        self.served += 1
+
+        params = message.decode().split(";")
+        try:
+            if params[0] == "BATCH":
+                return [address, empty, f"OK|{self._batch(message[6:])}".encode()]
+            if params[0] == "BARS_BIN":
+                bars, building = self._bars(*params[1:5])
+                data = (b"\x01" if building else b"\x00") + bars.tobytes()
+                return [address, empty, b"OK|" + data]
+
+            handler = getattr(self, f"_request_{params[0].lower()}", None)
+            if handler is None:
+                raise RuntimeError(f"Request is invalid {message.decode()}")
+            reply = f"OK|{handler(*params[1:])}"
+        except Exception as e:
+            reply = f"KO|{e}"
+        return [address, empty, reply.encode()]
+
+    def _batch(self, operations: bytes) -> str:
+        # one OK|result or KO|error line per trade operation
+        results = []
+        for operation in operations.decode().split("\n") if operations else []:
+            command, *params = operation.split(";")
+            try:
+                if command not in BATCH_COMMANDS:
+                    raise RuntimeError(f"Request is invalid {operation}")
+                result = getattr(self, f"_request_{command.lower()}")(*params)
+                results.append(f"OK|{result}")
+            except Exception as e:
+                results.append(f"KO|{e}")
+        return "\n".join(results)
+
+    def _request_ping(self, *params):
+        return "PONG"
+
+    def _request_protocol(self, *features):
+        enabled = []
+        for feature in features:
+            if feature == "BINARY":
+                self.binary = True
+            elif feature == "TOPICS":
+                self.topics = True
+            elif feature == "DELTA":
+                self.delta = True
+            elif feature == "EVENTS":
+                self.events = True
+            elif feature == "SEQ":
+                self.sequence = True
+            else:
+                continue
+            enabled.append(feature)
+        return ";".join(enabled)
+
+    def _request_time(self, *params):
+        return f"{time.time():f}"
+
+    def _request_bars(self, symbol, timeframe, start, end):
+        bars, building = self._bars(symbol, timeframe, start, end)
+        result = ";".join(_format_bar(bar) for bar in bars.tolist())
+        return f"{result};building" if building else result
+
+    def _request_markets(self, *params):
+        return ";".join(self._format_market(m) for m in self.markets.values())
+
+    def _request_quotes(self, *params):
+        return ";".join(self._format_quote(m) for m in self.markets.values())
+
+    def _request_sub_bars(self, symbol, timeframe):
+        self._market(symbol)
+        timeframe_seconds(timeframe)
+        self._bar_subscribers.add((symbol, timeframe))
+        return "OK"
+
+    def _request_unsub_bars(self, symbol, timeframe):
+        self._bar_subscribers.discard((symbol, timeframe))
+        return "OK"
+
+    def _request_sub_quotes(self, *symbols):
+        self._quote_subscribers.update(s for s in symbols if self._market(s))
+        return "OK"
+
+    def _request_unsub_quotes(self, *symbols):
+        self._quote_subscribers.difference_update(symbols)
+        return "OK"
+
+    def _request_sub_ticks(self, *symbols):
+        self._tick_subscribers.update(s for s in symbols if self._market(s))
+        return "OK"
+
+    def _request_unsub_ticks(self, *symbols):
+        self._tick_subscribers.difference_update(symbols)
+        return "OK"
+
+    def _request_unsub_all(self, *params):
+        self._bar_subscribers.clear()
+        self._quote_subscribers.clear()
+        self._tick_subscribers.clear()
+        return "OK"
+
+    def _request_account(self, *params):
+        return (
+            f"id={self.account}|name=Simulator|company=PyMetaTrader|server=Simulator"
+            "|type=DEMO|currency=USD|deposit=10000|margin=0|leverage=100|gmtoffset=0"
+        )
+
+    def _request_fund(self, *params):
+        pnl = sum(self._pnl(trade) for trade in self._trades.values())
+        return f"balance=10000|equity={10000 + pnl:g}"
+
+    def _request_orders(self, *params):
+        return ";".join(_format_record(o) for o in self._orders.values())
+
+    def _request_trades(self, symbol="", *params):
+        trades = [self._trade_record(t) for t in self._trades.values()]
+        return ";".join(
+            _format_record(t) for t in trades if not symbol or t["symbol"] == symbol
+        )
+
+    def _request_refresh(self, fromdate="", *params):
+        return f"{self._seq}\n{self._format_refresh()}"
+
+    def _request_deals(self, symbol="", fromdate=0, *params):
+        fromdate = float(fromdate or 0)
+        return ";".join(
+            _format_record(d)
+            for d in self._history_deals
+            if (not symbol or d["symbol"] == symbol) and d["time"] >= fromdate
+        )
+
+    def _request_open_order(self, symbol, type, lots, price, sl=0, tp=0, comment=""):
+        market = self._market(symbol)
+        ticket = self._next_ticket()
+        now = time.time()
+        order = dict(
+            ticket=ticket,
+            position=0,
+            symbol=symbol,
+            state="ORDER_STATE_PLACED",
+            type=type,
+            open_price=float(price or 0),
+            open_time=now,
+            close_time=0.0,
+            lots=float(lots),
+            sl=float(sl or 0),
+            tp=float(tp or 0),
+            expiration=0.0,
+            comment=comment,
+        )
+        if type not in MARKET_TYPES:
+            self._orders[ticket] = order
+        else:
+            price = market.ask if type == "BUY_MARKET" else market.bid
+            order.update(position=ticket, state="ORDER_STATE_FILLED", open_price=price)
+            order.update(close_time=now)
+            self._history_orders.append(order)
+            self._trades[ticket] = dict(order)
+            self._deal(order, "DEAL_ENTRY_IN", price)
+        self._refresh = True
+        return ticket
+
+    def _request_modify_order(self, ticket, price, sl=0, tp=0, expiration=0):
+        order = self._find(self._orders, ticket)
+        order.update(open_price=float(price or 0), sl=float(sl or 0), tp=float(tp or 0))
+        order.update(expiration=float(expiration or 0))
+        self._refresh = True
+        return ""
+
+    def _request_cancel_order(self, ticket):
+        order = self._orders.pop(int(self._find(self._orders, ticket)["ticket"]))
+        order.update(state="ORDER_STATE_CANCELED", close_time=time.time())
+        self._history_orders.append(order)
+        self._refresh = True
+        return ""
+
+    def _request_modify_trade(self, ticket, sl=0, tp=0):
+        trade = self._find(self._trades, ticket)
+        trade.update(sl=float(sl or 0), tp=float(tp or 0))
+        self._refresh = True
+        return ""
+
+    def _request_close_trade(self, ticket):
+        trade = self._trades.pop(int(self._find(self._trades, ticket)["ticket"]))
+        market = self._market(trade["symbol"])
+        price = market.bid if trade["type"] == "BUY_MARKET" else market.ask
+        self._deal(trade, "DEAL_ENTRY_OUT", price, pnl=self._pnl(trade))
+        self._refresh = True
+        return ""
+
+    # ----- PUBLICATIONS -----
+    def _publish(self, socket: zmq.Socket):
+        for market in self.markets.values():
+            if self.activity >= 1 or self._rng.random() < self.activity:
+                market.move(self._rng)
+
+        for type in ("BARS", "QUOTES", "TICKS"):
+            for message in self.publications(type):
+                self._send(socket, message)
+
+        if self._refresh:
+            self._refresh = False
+            if self.delta:
+                message = self._sequenced("REFRESH_DELTA ") + self._format_delta()
+            else:
+                message = self._sequenced("REFRESH ") + self._format_refresh()
+            self._send(socket, message.encode())
+
+    def publications(self, type: str, keys=None) -> list[bytes]:
+        # messages of one publication of a type for the subscribed symbols, or
+        # the given ones ((symbol, timeframe) for bars): one batch of all
+        # symbols, or one message per topic with TOPICS. With EVENTS only the
+        # symbols ticked since their last publication.
+        match type:
+            case "BARS":
+                keys = self._bar_subscribers if keys is None else keys
+                keys = self._changed(type, keys, lambda key: key[0])
+                records = [self._bar_update(*key) for key in sorted(keys)]
+                dtype = BAR_UPDATE_DTYPE
+            case "QUOTES":
+                keys = self._quote_subscribers if keys is None else keys
+                keys = self._changed(type, keys, lambda key: key)
+                records = [self._quote(symbol) for symbol in sorted(keys)]
+                dtype = QUOTE_DTYPE
+            case "TICKS":
+                keys = self._tick_subscribers if keys is None else keys
+                keys = self._changed(type, keys, lambda key: key)
+                records = [self._tick(symbol) for symbol in sorted(keys)]
+                dtype = TICK_DTYPE
+            case _:
+                raise RuntimeError(f"Unknown publication type: {type}")
+
+        if not records:
+            return []
+        if self.topics:
+            return [self._topic(type, r) + self._data(r, dtype) for r in records]
+
+        if self.binary:
+            data = b"".join(self._data(record, dtype) for record in records)
+        else:
+            data = b";".join(self._data(record, dtype) for record in records)
+        return [self._topic(type) + data]
+
+    def _changed(self, type: str, keys, symbol_of) -> list:
+        if not self.events:
+            return list(keys)
+
+        changed = []
+        for key in keys:
+            volume = self._market(symbol_of(key)).volume
+            if self._ticked.get((type, key)) != volume:
+                self._ticked[(type, key)] = volume
+                changed.append(key)
+        return changed
+
+    def _topic(self, type: str, record: dict = None) -> bytes:
+        topic = type + (BINARY_SUFFIX if self.binary else "")
+        if record is not None:
+            topic += f":{record['symbol']}"
+            if "timeframe" in record:
+                topic += f":{record['timeframe']}"
+        return self._sequenced(f"{topic} ").encode()
+
+    def _sequenced(self, topic: str) -> str:
+        # "TOPIC #<number> " with SEQ, numbered by topic from 1
+        if not self.sequence:
+            return topic
+        seq = self._sequences[topic] = self._sequences.get(topic, 0) + 1
+        return f"{topic}#{seq} "
+
+    def _data(self, record: dict, dtype: np.dtype) -> bytes:
+        if self.binary:
+            values = tuple(record[name] for name in dtype.names)
+            return np.array([values], dtype=dtype).tobytes()
+
+        if "timeframe" in record:
+            bar = [record[name] for name in BAR_DTYPE.names]
+            text = f"{record['symbol']}|{record['timeframe']}|{_format_bar(bar)}"
+        else:
+            text = _format_record(record)
+        return text.encode()
+
+    def _send(self, socket: zmq.Socket, message: bytes):
+        try:
+            socket.send(message, zmq.NOBLOCK)
+            self.published += 1
+        except zmq.Again:
+            pass
+
+    # ----- RECORDS -----
+    def _market(self, symbol: str) -> _Market:
+        market = self.markets.get(symbol)
+        if market is None:
+            raise RuntimeError(f"Unknown symbol {symbol}")
+        return market
+
+    def _bars(self, symbol, timeframe, start, end) -> tuple[np.ndarray, bool]:
+        market = self._market(symbol)
+        seconds = timeframe_seconds(timeframe)
+        now = time.time()
+        first = int(float(start)) // seconds * seconds
+        last = int(min(float(end), now)) // seconds * seconds
+        times = np.arange(
+            max(first, last - (MAX_BARS - 1) * seconds), last + 1, seconds
+        )
+
+        # the same range always gets the same bars
+        rng = np.random.default_rng([self._seed, zlib.crc32(symbol.encode()), first])
+        closes = (
+            market.bid + np.cumsum(rng.normal(0, 5, len(times)))[::-1] * market.point
+        )
+        spreads = rng.uniform(1, 5, len(times)) * market.point
+
+        bars = np.zeros(len(times), dtype=BAR_DTYPE)
+        bars["time"] = times
+        bars["open"] = np.round(np.roll(closes, 1), market.digits)
+        bars["close"] = np.round(closes, market.digits)
+        if len(bars):
+            bars["open"][0] = bars["close"][0]
+        high = np.maximum(bars["open"], bars["close"]) + spreads
+        low = np.minimum(bars["open"], bars["close"]) - spreads
+        bars["high"] = np.round(high, market.digits)
+        bars["low"] = np.round(low, market.digits)
+        bars["tick_volume"] = rng.integers(1, 1000, len(times))
+        bars["spread"] = 2
+        building = bool(len(bars)) and now < times[-1] + seconds
+        return bars, building
+
+    def _bar_update(self, symbol: str, timeframe: str) -> dict:
+        market = self._market(symbol)
+        seconds = timeframe_seconds(timeframe)
+        return dict(
+            symbol=symbol,
+            timeframe=timeframe,
+            time=float(int(time.time()) // seconds * seconds),
+            open=market.open,
+            high=market.high,
+            low=market.low,
+            close=market.bid,
+            tick_volume=market.volume,
+            spread=2.0,
+            real_volume=0.0,
+        )
+
+    def _quote(self, symbol: str) -> dict:
+        market = self._market(symbol)
+        change = market.bid - market.open
+        return dict(
+            symbol=symbol,
+            open=market.open,
+            high=market.high,
+            low=market.low,
+            close=market.bid,
+            volume=market.volume,
+            bid=market.bid,
+            ask=market.ask,
+            last=market.bid,
+            spread=2.0,
+            prev_close=market.open,
+            change=change,
+            change_percent=change / market.open * 100,
+        )
+
+    def _tick(self, symbol: str) -> dict:
+        market = self._market(symbol)
+        return dict(
+            symbol=symbol, bid=market.bid, ask=market.ask, spread=2.0, at=time.time()
+        )
+
+    def _format_market(self, market: _Market) -> str:
+        return _format_record(
+            dict(
+                symbol=market.symbol,
+                description=market.symbol,
+                exchange="",
+                category="Forex",
+                country="",
+                path=f"Forex\\{market.symbol}",
+                isin="",
+                currencybase=market.symbol[:3],
+                currencyprofit=market.symbol[3:],
+                currencymargin=market.symbol[:3],
+                point=market.point,
+                digits=market.digits,
+                minlot=0.01,
+                lotstep=0.01,
+                maxlot=100,
+                lotsize=100000,
+                ticksize=market.point,
+                tickvalue=1,
+                swaplong=0,
+                swapshort=0,
+                swaprollover=3,
+                session="",
+            )
+        )
+
+    def _format_quote(self, market: _Market) -> str:
+        return _format_record(self._quote(market.symbol))
+
+    def _format_refresh(self) -> str:
+        orders = ";".join(_format_record(o) for o in self._orders.values())
+        trades = [self._trade_record(t) for t in self._trades.values()]
+        return "\n".join(
+            [
+                "HISTORY_ORDERS "
+                + ";".join(_format_record(o) for o in self._history_orders[-10:]),
+                "HISTORY_DEALS "
+                + ";".join(_format_record(d) for d in self._history_deals[-10:]),
+                f"ORDERS {orders}",
+                "TRADES " + ";".join(_format_record(t) for t in trades),
+            ]
+        )
+
+    def _format_delta(self) -> str:
+        orders, deals = self._history_published
+        self._history_published = (len(self._history_orders), len(self._history_deals))
+
+        lines = [
+            "HISTORY_ORDERS "
+            + ";".join(_format_record(o) for o in self._history_orders[orders:]),
+            "HISTORY_DEALS "
+            + ";".join(_format_record(d) for d in self._history_deals[deals:]),
+        ]
+        removed = []
+        for kind, records in (
+            ("O", self._orders.values()),
+            ("T", [self._trade_record(t) for t in self._trades.values()]),
+        ):
+            current = {f"{kind}{r['ticket']}": _format_record(r) for r in records}
+            changed = [r for k, r in current.items() if self._published.get(k) != r]
+            gone = [k for k in self._published if k[0] == kind and k not in current]
+            for key in gone:
+                del self._published[key]
+            self._published.update(current)
+            lines.append(("ORDERS " if kind == "O" else "TRADES ") + ";".join(changed))
+            removed.append(";".join(key[1:] for key in gone))
+
+        self._seq += 1
+        lines.append(f"REMOVED_ORDERS {removed[0]}")
+        lines.append(f"REMOVED_TRADES {removed[1]}")
+        return f"{self._seq}\n" + "\n".join(lines)
+
+    def _trade_record(self, trade: dict) -> dict:
+        return dict(
+            ticket=trade["ticket"],
+            symbol=trade["symbol"],
+            type=trade["type"],
+            open_price=trade["open_price"],
+            open_time=trade["open_time"],
+            lots=trade["lots"],
+            sl=trade["sl"],
+            tp=trade["tp"],
+            pnl=self._pnl(trade),
+            swap=0.0,
+            comment=trade["comment"],
+        )
+
+    def _pnl(self, trade: dict) -> float:
+        market = self._market(trade["symbol"])
+        sign = 1 if trade["type"] == "BUY_MARKET" else -1
+        price = market.bid if sign > 0 else market.ask
+        return round(sign * (price - trade["open_price"]) * trade["lots"] * 100000, 2)
+
+    def _deal(self, order: dict, entry: str, price: float, pnl=0.0):
+        self._history_deals.append(
+            dict(
+                ticket=self._next_ticket(),
+                order=order["ticket"],
+                position=order["position"],
+                symbol=order["symbol"],
+                type=(
+                    "DEAL_TYPE_BUY"
+                    if (order["type"] == "BUY_MARKET") == (entry == "DEAL_ENTRY_IN")
+                    else "DEAL_TYPE_SELL"
+                ),
+                entry=entry,
+                price=price,
+                time=time.time(),
+                lots=order["lots"],
+                sl=order["sl"],
+                tp=order["tp"],
+                commission=0.0,
+                swap=0.0,
+                pnl=pnl,
+                comment=order["comment"],
+            )
+        )
+
+    def _find(self, records: dict, ticket) -> dict:
+        record = records.get(int(ticket))
+        if record is None:
+            raise RuntimeError(f"Unknown ticket {ticket}")
+        return record
+
+    def _next_ticket(self) -> int:
+        self._ticket += 1
+        return self._ticket
+
+
+def _format_bar(bar) -> str:
+    return "%f|%g|%g|%g|%g|%g|%g|%g" % tuple(bar)
+
+
+def _format_record(record: dict) -> str:
+    fields = []
+    for key, value in record.items():
+        if isinstance(value, float):
+            value = ("%f" if key in TIME_FIELDS else "%g") % value
+        fields.append(f"{key}={value}")
+    return "|".join(fields)
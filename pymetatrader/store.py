@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+
+import numpy as np
+
+from .bars import BAR_DTYPE, empty_bars
+
+logger = logging.getLogger("PyMetaTrader:BarStore")
+
+
+class BarStore:
+    # Closed bars are kept per symbol/timeframe in a flat file of BAR_DTYPE
+    # records sorted by time, next to a small json file with the time ranges
+    # already requested from the terminal: only the missing parts of a range
+    # are requested again.
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _file(self, symbol: str, timeframe: str, ext="bars"):
+        return os.path.join(self.path, symbol, f"{timeframe}.{ext}")
+
+    def coverage(self, symbol: str, timeframe: str) -> tuple | None:
+        # (earliest requested time, time of the last stored bar)
+        ranges = self.ranges(symbol, timeframe)
+        if not ranges:
+            return None
+        return ranges[0][0], self._last(symbol, timeframe)
+
+    def ranges(self, symbol: str, timeframe: str) -> list[list]:
+        # [start, end] in milliseconds requested and stored, sorted
+        meta = self._read_meta(symbol, timeframe)
+        ranges = meta.get("ranges")
+        if ranges is not None:
+            return ranges
+
+        # written before ranges: from the earliest request to the last bar
+        last = self._last(symbol, timeframe)
+        if last is None:
+            return []
+        start = meta.get("start")
+        if start is None:
+            start = float(self.read(symbol, timeframe)[0]["time"])
+        return [[start, last]]
+
+    def missing(self, symbol: str, timeframe: str, start, end) -> list[tuple]:
+        # parts of [start, end] to request, MTServer ranges are inclusive
+        # and in seconds
+        gaps = []
+        for first, last in self.ranges(symbol, timeframe):
+            if last < start:
+                continue
+            if first > end:
+                break
+            if first > start:
+                gaps.append((start, first - 1000))
+            start = last + 1000
+        if start <= end:
+            gaps.append((start, end))
+        return gaps
+
+    def _last(self, symbol: str, timeframe: str) -> float | None:
+        file = self._file(symbol, timeframe)
+        try:
+            size = os.path.getsize(file)
+        except FileNotFoundError:
+            return None
+        if size < BAR_DTYPE.itemsize:
+            return None
+
+        with open(file, "rb") as f:
+            f.seek(size - size % BAR_DTYPE.itemsize - BAR_DTYPE.itemsize)
+            last = np.frombuffer(f.read(BAR_DTYPE.itemsize), dtype=BAR_DTYPE)[0]
+        return float(last["time"])
+
+    def read(self, symbol: str, timeframe: str, start=None, end=None) -> np.ndarray:
+        file = self._file(symbol, timeframe)
+        if not os.path.exists(file) or os.path.getsize(file) < BAR_DTYPE.itemsize:
+            return empty_bars()
+
+        count = os.path.getsize(file) // BAR_DTYPE.itemsize
+        bars = np.memmap(file, dtype=BAR_DTYPE, mode="r", shape=(count,))
+        times = bars["time"]
+        lo = 0 if start is None else np.searchsorted(times, start, "left")
+        hi = len(bars) if end is None else np.searchsorted(times, end, "right")
+
+        # copy out of the map, the file can be rewritten by the next merge
+        result = np.array(bars[lo:hi])
+        return result
+
+    def write(
+        self, symbol: str, timeframe: str, bars: np.ndarray, start=None, end=None
+    ):
+        # bars of the requested range [start, end], complete up to the last
+        # stored bar: later bars can still come
+        ranges = self.ranges(symbol, timeframe)
+        if len(bars):
+            self._write_bars(symbol, timeframe, bars)
+        if start is None:
+            return
+
+        last = self._last(symbol, timeframe)
+        if last is None:
+            return
+        end = last if end is None else min(end, last)
+        if end < start:
+            return
+
+        merged = []
+        for first, last in sorted(ranges + [[start, end]]):
+            if merged and first <= merged[-1][1] + 1000:
+                merged[-1][1] = max(merged[-1][1], last)
+            else:
+                merged.append([first, last])
+
+        meta = self._read_meta(symbol, timeframe)
+        meta.pop("start", None)
+        meta["ranges"] = merged
+        self._write_meta(symbol, timeframe, meta)
+
+    def _write_bars(self, symbol: str, timeframe: str, bars: np.ndarray):
+        file = self._file(symbol, timeframe)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+
+        last = self._last(symbol, timeframe)
+        bars = np.ascontiguousarray(bars, dtype=BAR_DTYPE)
+
+        # append only: new bars after the last stored one
+        if last is None or bars[0]["time"] > last:
+            if last is None and os.path.exists(file):
+                os.remove(file)
+            with open(file, "ab") as f:
+                # drop a partially written record left by an interrupted append
+                f.truncate(f.tell() - f.tell() % BAR_DTYPE.itemsize)
+                f.write(bars.tobytes())
+            return
+
+        # merge: fetched bars overwrite stored bars of the same time
+        merged = np.concatenate([bars, self.read(symbol, timeframe)])
+        _, index = np.unique(merged["time"], return_index=True)
+        merged = merged[index]
+
+        tmp = f"{file}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(merged.tobytes())
+        os.replace(tmp, file)
+        logger.debug("Merged %d bars into %s", len(bars), file)
+
+    def _read_meta(self, symbol: str, timeframe: str) -> dict:
+        try:
+            with open(self._file(symbol, timeframe, "json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return dict()
+
+    def _write_meta(self, symbol: str, timeframe: str, meta: dict):
+        file = self._file(symbol, timeframe, "json")
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(file, "w") as f:
+            json.dump(meta, f)
@@ -8,5 +8,5 @@ setup(
     author='Santatic',
     license='Private',
     packages=['pymetatrader'],
-    install_requires=['zmq'],
+    install_requires=['zmq', 'numpy'],
 )
\ No newline at end of file
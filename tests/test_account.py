@@ -0,0 +1,114 @@
+import asyncio
+
+from pymetatrader.account import EVENT_CHANGED, EVENT_NEW, EVENT_REMOVED, AccountState
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def snapshot(orders=(), trades=(), history_orders=(), history_deals=()):
+    return dict(
+        orders=list(orders),
+        trades=list(trades),
+        history_orders=list(history_orders),
+        history_deals=list(history_deals),
+    )
+
+
+def delta(seq, removed_orders=(), removed_trades=(), **records):
+    return dict(
+        seq=seq,
+        removed_orders=list(removed_orders),
+        removed_trades=list(removed_trades),
+        **snapshot(**records),
+    )
+
+
+def trade(ticket, profit=0.0):
+    return dict(ticket=ticket, symbol="EURUSD", profit=profit)
+
+
+def recording(state: AccountState) -> list:
+    events = []
+
+    async def listener(kind, event, record):
+        events.append((kind, event, record["ticket"]))
+
+    state.add_listener(listener)
+    return events
+
+
+def test_snapshot_emits_new_changed_and_removed_records():
+    async def main():
+        state = AccountState()
+        events = recording(state)
+        await state.apply_snapshot(snapshot(trades=[trade(1), trade(2)]), seq=5)
+        await state.apply_snapshot(snapshot(trades=[trade(1, profit=3)]), seq=6)
+
+        assert events == [
+            ("trades", EVENT_NEW, 1),
+            ("trades", EVENT_NEW, 2),
+            ("trades", EVENT_REMOVED, 2),
+            ("trades", EVENT_CHANGED, 1),
+        ]
+        assert state.trade(1)["profit"] == 3
+        assert state.trade(2) is None
+        assert state.seq == 6
+
+    run(main())
+
+
+def test_delta_before_snapshot_asks_for_reload():
+    async def main():
+        state = AccountState()
+        assert not await state.apply_delta(delta(7, trades=[trade(1)]))
+        assert state.trade(1) is None
+        assert state.seq is None
+
+        # a plain REFRESH snapshot has no sequence either
+        assert await state.update("REFRESH", snapshot(trades=[trade(2)]))
+        assert not await state.update("REFRESH_DELTA", delta(8))
+
+    run(main())
+
+
+def test_deltas_apply_in_sequence():
+    async def main():
+        state = AccountState()
+        await state.apply_snapshot(snapshot(trades=[trade(1)]), seq=10)
+        events = recording(state)
+
+        assert await state.apply_delta(delta(11, trades=[trade(2)]))
+        assert await state.apply_delta(delta(12, removed_trades=[1]))
+        assert events == [("trades", EVENT_NEW, 2), ("trades", EVENT_REMOVED, 1)]
+        assert list(state.trades) == [2]
+
+        # already part of the snapshot
+        assert await state.apply_delta(delta(9, trades=[trade(3)]))
+        assert state.trade(3) is None
+
+    run(main())
+
+
+def test_missed_delta_asks_for_reload():
+    async def main():
+        state = AccountState()
+        await state.apply_snapshot(snapshot(), seq=1)
+        assert not await state.apply_delta(delta(3, trades=[trade(1)]))
+        # applied anyway, the reload completes it
+        assert state.trade(1) is not None
+        assert state.seq == 3
+
+    run(main())
+
+
+def test_restarted_terminal_asks_for_reload():
+    async def main():
+        state = AccountState()
+        await state.apply_snapshot(snapshot(), seq=40)
+        assert not await state.apply_delta(delta(1))
+        assert state.seq == 1
+        assert await state.apply_delta(delta(2))
+
+    run(main())
@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from pymetatrader.aggregator import BarAggregator, aggregate_seconds, bar_period
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def utc(*args) -> float:
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def tick(at, bid, symbol="EURUSD", spread=2):
+    return dict(symbol=symbol, at=at, bid=bid, ask=bid, spread=spread)
+
+
+@pytest.mark.parametrize(
+    "timeframe, seconds",
+    [
+        ("M1", 60),
+        ("H4", 4 * 3600),
+        ("S5", 5),
+        ("M7", 7 * 60),
+        ("D2", 2 * 86400),
+        (90, 90),
+    ],
+)
+def test_aggregate_seconds(timeframe, seconds):
+    assert aggregate_seconds(timeframe) == seconds
+
+
+@pytest.mark.parametrize("timeframe", ["X1", "M", "S0", 0, "Mx"])
+def test_aggregate_seconds_rejects_unknown_timeframes(timeframe):
+    with pytest.raises(RuntimeError):
+        aggregate_seconds(timeframe)
+
+
+def test_weekly_bars_open_on_sunday():
+    # Wednesday 2024-12-18
+    start, end = bar_period(utc(2024, 12, 18, 15), "W1", aggregate_seconds("W1"))
+    assert start == utc(2024, 12, 15)
+    assert end == utc(2024, 12, 22)
+    assert bar_period(utc(2024, 12, 15), "W1", aggregate_seconds("W1"))[0] == start
+
+
+@pytest.mark.parametrize(
+    "at, start, end",
+    [
+        (utc(2024, 2, 29, 23), utc(2024, 2, 1), utc(2024, 3, 1)),
+        (utc(2024, 12, 31, 23), utc(2024, 12, 1), utc(2025, 1, 1)),
+        (utc(2025, 1, 1), utc(2025, 1, 1), utc(2025, 2, 1)),
+    ],
+)
+def test_monthly_bars_follow_calendar_months(at, start, end):
+    assert bar_period(at, "MN1", aggregate_seconds("MN1")) == (start, end)
+
+
+def test_aggregator_builds_and_closes_bars():
+    async def main():
+        aggregator = BarAggregator(["M1"], size=2)
+        closed = []
+
+        async def listener(symbol, timeframe, bar):
+            closed.append((symbol, timeframe, list(bar)))
+
+        aggregator.add_listener(listener)
+        await aggregator.update("QUOTES", [tick(0, 9.0)])
+        await aggregator.update("TICKS", [tick(60, 1.0), tick(70, 3.0), tick(80, 0.5)])
+        await aggregator.update("TICKS", [tick(119, 2.0), tick(120, 4.0)])
+
+        assert closed == [
+            ("EURUSD", "M1", [60 * 1000, 1.0, 3.0, 0.5, 2.0, 4, 2, 0]),
+        ]
+        assert aggregator.last("EURUSD", "M1")[:5] == [120 * 1000, 4.0, 4.0, 4.0, 4.0]
+
+        await aggregator.close_expired(179)
+        assert len(closed) == 1
+        await aggregator.close_expired(180)
+        assert len(closed) == 2
+        assert aggregator.last("EURUSD", "M1") is None
+
+    run(main())
+
+
+def test_aggregator_ring_buffer_keeps_last_bars():
+    async def main():
+        aggregator = BarAggregator(["S5"], size=3)
+        await aggregator.update(
+            "TICKS", [tick(at, float(at)) for at in range(0, 30, 5)]
+        )
+
+        bars = aggregator.bars("EURUSD", "S5")
+        assert bars["time"].tolist() == [10000, 15000, 20000]
+        building = aggregator.bars("EURUSD", "S5", building=True)
+        assert building["time"].tolist() == [10000, 15000, 20000, 25000]
+        assert len(aggregator.bars("GBPUSD", "S5")) == 0
+
+    run(main())
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+import pymetatrader.api as api_module
+from pymetatrader import MetaTrader
+from pymetatrader.bars import split_range
+
+MINUTE = 60 * 1000
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def fake_bars(api: MetaTrader, failures: dict = None):
+    # get_bars of one bar per minute, failing `failures[start]` times
+    failures = dict(failures or dict())
+    calls = []
+
+    async def get_bars(symbol, timeframe, start, end, as_array=False):
+        calls.append((start, end))
+        await asyncio.sleep(0.001 * ((start // MINUTE) % 3))
+        if failures.get(start):
+            failures[start] -= 1
+            raise RuntimeError("Request expired")
+        # the first bar overlaps the previous chunk
+        first = max(start - MINUTE, 0)
+        bars = [[t, 1.0, 1.0, 1.0, 1.0, 1, 0, 0] for t in range(first, end + 1, MINUTE)]
+        return bars, False
+
+    api.get_bars = get_bars
+    return calls
+
+
+async def collect(api: MetaTrader, start, end, **options) -> list:
+    times = []
+    async for bars, _ in api.backfill_bars("EURUSD", "M1", start, end, **options):
+        times += [bar[0] for bar in bars]
+    return times
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(api_module, "CHUNK_RETRY_DELAY", 0)
+
+
+def test_backfill_stitches_chunks_in_order():
+    api = MetaTrader()
+    calls = fake_bars(api)
+    times = run(collect(api, 0, 99 * MINUTE, size=10, concurrency=4))
+    assert times == [t * MINUTE for t in range(100)]
+    assert sorted(calls) == split_range(0, 99 * MINUTE, "M1", 10)
+
+
+def test_backfill_retries_failed_chunks():
+    api = MetaTrader()
+    calls = fake_bars(api, failures={20 * MINUTE: 2})
+    times = run(collect(api, 0, 49 * MINUTE, size=10))
+    assert times == [t * MINUTE for t in range(50)]
+    assert calls.count((20 * MINUTE, 30 * MINUTE - 1000)) == 3
+
+
+def test_backfill_raises_instead_of_skipping_a_chunk():
+    api = MetaTrader()
+    fake_bars(api, failures={20 * MINUTE: api_module.CHUNK_ATTEMPTS})
+    with pytest.raises(RuntimeError, match="Missing bars EURUSD M1"):
+        run(collect(api, 0, 49 * MINUTE, size=10))
@@ -0,0 +1,40 @@
+import pytest
+
+from pymetatrader.bars import parse_bars_array, split_range
+
+MINUTE = 60 * 1000
+
+
+def test_split_range_in_chunks_of_bars():
+    assert split_range(0, 25 * MINUTE, "M1", 10) == [
+        (0, 10 * MINUTE - 1000),
+        (10 * MINUTE, 20 * MINUTE - 1000),
+        (20 * MINUTE, 25 * MINUTE),
+    ]
+    assert split_range(0, 0, "H1", 10) == [(0, 0)]
+    assert split_range(1, 0, "M1", 10) == []
+
+
+def test_split_range_rejects_unknown_timeframes():
+    with pytest.raises(RuntimeError, match="Unknown timeframe"):
+        split_range(0, MINUTE, "M7", 10)
+
+
+def test_parse_bars_array():
+    bars, building = parse_bars_array("60|1|2|0.5|1.5|10|2|0;120|1.5|3|1|2|5|2|0|")
+    assert not building
+    assert bars["time"].tolist() == [60 * 1000, 120 * 1000]
+    assert bars["high"].tolist() == [2, 3]
+    assert bars[1].tolist() == (120 * 1000, 1.5, 3, 1, 2, 5, 2, 0)
+
+    bars, building = parse_bars_array("60|1|2|0.5|1.5|10|2|0;building")
+    assert building and len(bars) == 1
+
+    bars, building = parse_bars_array("")
+    assert len(bars) == 0 and not building
+
+
+@pytest.mark.parametrize("data", ["60|1|2|0.5|1.5|10|2", "60|1|x|0.5|1.5|10|2|0"])
+def test_parse_bars_array_rejects_incomplete_bars(data):
+    with pytest.raises(RuntimeError, match="Cannot parse bars"):
+        parse_bars_array(data)
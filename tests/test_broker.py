@@ -0,0 +1,41 @@
+import logging
+
+import pytest
+
+from pymetatrader.broker import _Router
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def send_multipart(self, msg):
+        self.sent.append(msg)
+
+
+def router() -> _Router:
+    return _Router(client_socket=FakeSocket(), worker_socket=FakeSocket())
+
+
+def test_ready_announces_worker_capacity():
+    r = router()
+    r.on_worker([b"W1", b"", b"READY;1234;2"])
+    worker = r.workers.workers[b"W1"]
+    assert worker.account == b"1234" and worker.capacity == 2
+
+    r.on_client([b"C1", b"", b"TIME"])
+    r.on_client([b"C2", b"", b"TIME"])
+    assert [msg[2] for msg in r.worker_socket.sent] == [b"C1", b"C2"]
+
+
+@pytest.mark.parametrize("field", [b"", b"x", b"0", b"-3", b"2.5"])
+def test_ready_with_invalid_capacity_falls_back_to_one(field, caplog):
+    r = router()
+    with caplog.at_level(logging.WARNING, logger="PyMetaTrader:MT5MQBroker"):
+        r.on_worker([b"W1", b"", b"READY;1234;" + field])
+    assert r.workers.workers[b"W1"].capacity == 1
+    assert "Invalid worker capacity" in caplog.text
+
+    r.on_client([b"C1", b"", b"TIME"])
+    r.on_client([b"C2", b"", b"TIME"])
+    assert len(r.worker_socket.sent) == 1
@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+from pymetatrader.cache import LastValueCache, ResponseCache
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def counting_fetch(response="OK", delay=0.0):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return response
+
+    return fetch, calls
+
+
+def test_response_cache_coalesces_concurrent_requests():
+    async def main():
+        cache = ResponseCache(dict(TIME=0))
+        fetch, calls = counting_fetch(delay=0.01)
+        results = await asyncio.gather(*[cache.get(("TIME",), fetch) for _ in range(5)])
+        assert results == ["OK"] * 5
+        assert len(calls) == 1
+
+        # TTL 0: shared while in flight only
+        await cache.get(("TIME",), fetch)
+        assert len(calls) == 2
+
+    run(main())
+
+
+def test_response_cache_reuses_response_for_ttl():
+    async def main():
+        cache = ResponseCache(dict(MARKETS=60))
+        fetch, calls = counting_fetch()
+        await cache.get(("MARKETS",), fetch)
+        await cache.get(("MARKETS",), fetch)
+        assert len(calls) == 1
+
+        cache.invalidate("MARKETS")
+        await cache.get(("MARKETS",), fetch)
+        assert len(calls) == 2
+
+    run(main())
+
+
+def test_response_cache_skips_commands_without_ttl():
+    async def main():
+        cache = ResponseCache(dict(TIME=0))
+        fetch, calls = counting_fetch(delay=0.01)
+        await asyncio.gather(*[cache.get(("OPEN_ORDER",), fetch) for _ in range(3)])
+        assert len(calls) == 3
+
+    run(main())
+
+
+def test_response_cache_leader_cancellation_spares_followers():
+    async def main():
+        cache = ResponseCache(dict(ACCOUNT=1))
+        fetch, calls = counting_fetch(delay=0.05)
+        leader = asyncio.ensure_future(cache.get(("ACCOUNT",), fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.get(("ACCOUNT",), fetch))
+        await asyncio.sleep(0.01)
+
+        leader.cancel()
+        assert await follower == "OK"
+        assert leader.cancelled()
+        assert len(calls) == 1
+
+    run(main())
+
+
+def test_response_cache_shares_errors():
+    async def main():
+        cache = ResponseCache(dict(FUND=0))
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("KO")
+
+        results = await asyncio.gather(
+            *[cache.get(("FUND",), fetch) for _ in range(3)], return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    run(main())
+
+
+def test_response_cache_drops_responses_fetched_across_invalidation():
+    async def main():
+        cache = ResponseCache(dict(ACCOUNT=10, MARKETS=10))
+        stale, calls = counting_fetch("stale", delay=0.02)
+        fresh, _ = counting_fetch("fresh")
+
+        inflight = asyncio.ensure_future(cache.get(("ACCOUNT",), stale))
+        markets = asyncio.ensure_future(cache.get(("MARKETS",), stale))
+        await asyncio.sleep(0.01)
+        # e.g. a trade or a REFRESH while the account is being fetched
+        cache.invalidate("ACCOUNT")
+
+        # a later request does not join the outdated one
+        assert await cache.get(("ACCOUNT",), fresh) == "fresh"
+        assert await inflight == "stale"
+        assert await cache.get(("ACCOUNT",), stale) == "fresh"
+
+        # other commands are still cached
+        await markets
+        assert await cache.get(("MARKETS",), fresh) == "stale"
+
+        cache.invalidate()
+        assert await cache.get(("MARKETS",), fresh) == "fresh"
+
+    run(main())
+
+
+def test_last_value_cache_notifies_changes_only():
+    async def main():
+        cache = LastValueCache()
+        changes = []
+
+        async def listener(record):
+            changes.append(record["bid"])
+
+        cache.add_listener(listener)
+        await cache.update([dict(symbol="EURUSD", bid=1.0)])
+        await cache.update([dict(symbol="EURUSD", bid=1.0), dict(symbol="X", bid=2)])
+        assert changes == [1.0, 2]
+        assert cache.get("EURUSD")["bid"] == 1.0
+        assert sorted(cache.symbols()) == ["EURUSD", "X"]
+
+    run(main())
+
+
+@pytest.mark.parametrize("ttl", [0, 1])
+def test_response_cache_failed_fetch_is_not_cached(ttl):
+    async def main():
+        cache = ResponseCache(dict(TIME=ttl))
+        attempts = []
+
+        async def fetch():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("KO")
+            return "OK"
+
+        with pytest.raises(RuntimeError):
+            await cache.get(("TIME",), fetch)
+        assert await cache.get(("TIME",), fetch) == "OK"
+
+    run(main())
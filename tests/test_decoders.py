@@ -0,0 +1,42 @@
+import pytest
+
+from pymetatrader.decoders import RecordDecoder
+from pymetatrader.models import Quote
+
+FORMAT = dict(bid=float, ask=float, at=float)
+
+
+def test_decodes_batches_of_the_same_layout():
+    decoder = RecordDecoder(FORMAT, millis=("at",))
+    data = "symbol=EURUSD|bid=1.1|ask=1.2|at=10;;symbol=X|bid=2|ask=3|at=11.5;"
+    assert decoder.decode(data) == [
+        dict(symbol="EURUSD", bid=1.1, ask=1.2, at=10000),
+        dict(symbol="X", bid=2, ask=3, at=11500),
+    ]
+    assert decoder.decode(data, tuple)[1] == ("X", 2, 3, 11500)
+    quote = decoder.decode(data, Quote)[0]
+    assert quote.bid == 1.1 and quote.last is None
+    assert decoder.decode("") == []
+
+
+@pytest.mark.parametrize(
+    "second",
+    [
+        # same field count, other keys or order
+        "symbol=X|ask=3|bid=2|at=11",
+        "symbol=X|bid=2|ask=3|time=11",
+        # `|` inside a value
+        "symbol=X|bid=2|ask=3|at=11|comment=a|b",
+    ],
+)
+def test_records_of_another_layout_are_decoded_by_key(second):
+    decoder = RecordDecoder(FORMAT)
+    records = decoder.decode("symbol=EURUSD|bid=1|ask=1.5|at=10;" + second)
+    assert records[0] == dict(symbol="EURUSD", bid=1, ask=1.5, at=10)
+    assert records[1]["bid"] == 2 and records[1]["ask"] == 3
+
+
+def test_invalid_values_raise():
+    decoder = RecordDecoder(FORMAT)
+    with pytest.raises(RuntimeError, match="Cannot parse value x by key bid"):
+        decoder.decode("symbol=EURUSD|bid=1|ask=1|at=1;symbol=X|bid=x|ask=1|at=1")
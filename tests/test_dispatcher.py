@@ -0,0 +1,132 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from pymetatrader import MetaTrader
+from pymetatrader.dispatcher import (
+    POLICY_BLOCK,
+    POLICY_CONFLATE,
+    POLICY_DROP_OLDEST,
+    SubscriptionDispatcher,
+)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def slow_consumer(delivered: list):
+    release = asyncio.Event()
+
+    async def callback(msg):
+        await release.wait()
+        delivered.append(msg)
+
+    return callback, release
+
+
+async def drain(dispatcher: SubscriptionDispatcher, release: asyncio.Event):
+    release.set()
+    for _ in range(10):
+        await asyncio.sleep(0)
+    dispatcher.stop()
+
+
+def test_block_keeps_every_frame_in_order():
+    async def main():
+        delivered = []
+        callback, release = slow_consumer(delivered)
+        dispatcher = SubscriptionDispatcher(callback, size=10)
+        for i in range(5):
+            await dispatcher.dispatch(b"TICKS:EURUSD %d" % i)
+        await drain(dispatcher, release)
+        assert delivered == [b"TICKS:EURUSD %d" % i for i in range(5)]
+
+    run(main())
+
+
+def test_conflate_keeps_latest_frame_per_topic():
+    async def main():
+        delivered = []
+        callback, release = slow_consumer(delivered)
+        dispatcher = SubscriptionDispatcher(callback, policy=POLICY_CONFLATE)
+        for i in range(5):
+            await dispatcher.dispatch(b"TICKS:EURUSD %d" % i)
+            await dispatcher.dispatch(b"TICKS:GBPUSD %d" % i)
+        await asyncio.sleep(0)
+        stats = dispatcher.stats()
+        await drain(dispatcher, release)
+
+        assert delivered == [b"TICKS:EURUSD 4", b"TICKS:GBPUSD 4"]
+        assert stats["TICKS:EURUSD"]["conflated"] == 4
+
+    run(main())
+
+
+def test_drop_oldest_bounds_the_queue():
+    async def main():
+        delivered = []
+        callback, release = slow_consumer(delivered)
+        dispatcher = SubscriptionDispatcher(
+            callback, size=2, policies=dict(QUOTES=POLICY_DROP_OLDEST)
+        )
+        for i in range(6):
+            await dispatcher.dispatch(b"QUOTES %d" % i)
+        await asyncio.sleep(0)
+        assert dispatcher.stats()["QUOTES"]["dropped"] == 4
+        await drain(dispatcher, release)
+        assert delivered == [b"QUOTES 4", b"QUOTES 5"]
+
+    run(main())
+
+
+def test_set_policy_applies_to_received_topics():
+    async def main():
+        delivered = []
+        callback, release = slow_consumer(delivered)
+        dispatcher = SubscriptionDispatcher(callback, policy=POLICY_CONFLATE)
+        await dispatcher.dispatch(b"TICKS 0")
+        dispatcher.set_policy("TICKS", POLICY_BLOCK)
+        assert dispatcher.policy_of("TICKS") == POLICY_BLOCK
+        assert dispatcher.policy_of("QUOTES") == POLICY_CONFLATE
+
+        await asyncio.sleep(0)
+        await dispatcher.dispatch(b"TICKS 1")
+        blocked = asyncio.ensure_future(dispatcher.dispatch(b"TICKS 2"))
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        await drain(dispatcher, release)
+        assert blocked.done()
+
+    run(main())
+
+
+def test_unknown_policy_is_refused():
+    with pytest.raises(RuntimeError):
+        SubscriptionDispatcher(None, policy="latest")
+
+
+@pytest.mark.parametrize(
+    "features, policy",
+    [
+        ("SEQ;EVENTS", POLICY_BLOCK),
+        ("SEQ;EVENTS;TOPICS", POLICY_CONFLATE),
+        ("SEQ", POLICY_CONFLATE),
+    ],
+)
+def test_events_batches_are_not_conflated(features, policy):
+    async def main():
+        async def request(*params, timeout=None, raw=False):
+            return f"OK|{features}"
+
+        api = MetaTrader()
+        dispatcher = SubscriptionDispatcher(None, policy=POLICY_CONFLATE)
+        api._client = SimpleNamespace(dispatcher=dispatcher, request=request)
+        await api.negotiate(*features.split(";"))
+
+        for type in ("BARS", "QUOTES", "TICKS"):
+            assert dispatcher.policy_of(type) == policy
+        assert dispatcher.policy_of("REFRESH") == POLICY_CONFLATE
+
+    run(main())
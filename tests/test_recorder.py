@@ -0,0 +1,65 @@
+import asyncio
+import os
+
+import numpy as np
+
+from pymetatrader.recorder import (
+    RECORD_DTYPES,
+    RECORD_FIELDS,
+    TickReader,
+    TickRecorder,
+    encode_segment,
+    read_header,
+    read_segment,
+)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def records(count: int) -> np.ndarray:
+    result = np.zeros(count, dtype=RECORD_DTYPES["QUOTES"])
+    result["received"] = 1.7e9 + np.arange(count) * 0.001234
+    result["bid"] = np.round(1.08 + np.arange(count) * 1e-5, 5)
+    # columns without a fixed point encoding stay raw
+    result["ask"] = np.nan
+    result["ask"][1:] = np.pi
+    return result
+
+
+def test_segment_round_trip(tmp_path):
+    expected = records(1000)
+    file = str(tmp_path / "segment.seg")
+    with open(file, "wb") as f:
+        f.write(encode_segment("QUOTES", "EURUSD", expected))
+
+    header = read_header(file)
+    assert header["count"] == 1000 and header["symbol"] == "EURUSD"
+    encodings = {column["name"]: column["encoding"] for column in header["columns"]}
+    assert encodings["bid"] == "delta" and encodings["ask"] == "raw"
+
+    actual = read_segment(file)
+    for name in expected.dtype.names:
+        np.testing.assert_array_equal(actual[name], expected[name])
+
+
+def test_recorder_and_reader(tmp_path):
+    async def main():
+        recorder = TickRecorder(str(tmp_path), types=["TICKS"], segment_size=3)
+        fields = RECORD_FIELDS["TICKS"]
+        for i in range(7):
+            tick = dict.fromkeys(fields, 0.0)
+            tick.update(symbol="EURUSD", bid=float(i))
+            await recorder.record("TICKS", [tick])
+        await recorder.record("QUOTES", [dict(symbol="EURUSD")])
+        await recorder.close()
+        return recorder.recorded
+
+    assert run(main()) == 7
+    reader = TickReader(str(tmp_path))
+    assert reader.types() == ["TICKS"]
+    assert len(reader.segments("TICKS", "EURUSD")) == 3
+    ticks = reader.read("TICKS", "EURUSD")
+    assert ticks["bid"].tolist() == list(range(7))
+    assert os.listdir(tmp_path / "TICKS") == ["EURUSD"]
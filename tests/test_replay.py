@@ -0,0 +1,37 @@
+import asyncio
+
+import numpy as np
+
+from pymetatrader.bars import BAR_DTYPE
+from pymetatrader.replay import Replayer
+from pymetatrader.store import BarStore
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_replay_merges_bars_and_events_in_seconds(tmp_path):
+    store = BarStore(str(tmp_path))
+    bars = np.zeros(10, dtype=BAR_DTYPE)
+    bars["time"] = np.arange(10) * 60 * 1000
+    store.write("EURUSD", "M1", bars)
+
+    received = []
+
+    async def callback(type, data):
+        received.append((type, data[0][2][0] if type == "BARS" else data))
+
+    replayer = Replayer(callback)
+    replayer.add_bars(store, "EURUSD", "M1", start=120, end=300)
+    replayer.add_events([(200, "REFRESH", "refresh")])
+    assert run(replayer.run()) == 5
+
+    # bars opened at 2-5 minutes, each published when it closes
+    assert received == [
+        ("BARS", 120 * 1000),
+        ("REFRESH", "refresh"),
+        ("BARS", 180 * 1000),
+        ("BARS", 240 * 1000),
+        ("BARS", 300 * 1000),
+    ]
@@ -0,0 +1,56 @@
+from pymetatrader.sequence import SequenceTracker
+
+
+def test_check_counts_missed_publications():
+    tracker = SequenceTracker()
+    assert tracker.check("QUOTES:EURUSD", 5) == 0
+    assert tracker.check("QUOTES:EURUSD", 6) == 0
+    assert tracker.check("QUOTES:EURUSD", 9) == 2
+    assert tracker.check("QUOTES:GBPUSD", 9) == 0
+    assert tracker.missed == {"QUOTES:EURUSD": 2}
+
+
+def test_check_ignores_repeated_publications():
+    tracker = SequenceTracker()
+    tracker.check("TICKS:EURUSD", 5)
+    assert tracker.check("TICKS:EURUSD", 4) == 0
+    assert tracker.check("TICKS:EURUSD", 5) == 0
+    assert tracker.check("TICKS:EURUSD", 6) == 0
+    assert tracker.missed == dict()
+
+
+def test_check_counts_a_restart_as_one_missed():
+    tracker = SequenceTracker()
+    tracker.check("BARS:EURUSD:M1", 40)
+    assert tracker.check("BARS:EURUSD:M1", 1) == 1
+    assert tracker.check("BARS:EURUSD:M1", 2) == 0
+
+
+def test_observe_keeps_gaps_until_taken():
+    tracker = SequenceTracker()
+    tracker.observe(b"QUOTES:EURUSD #1 symbol=EURUSD")
+    tracker.observe(b"QUOTES:EURUSD #4 symbol=EURUSD")
+    tracker.observe(b"QUOTES:EURUSD #7")
+    # not numbered
+    tracker.observe(b"BARS:#AAPL:M1 #x")
+    tracker.observe(b"REFRESH")
+
+    assert tracker.take("QUOTES:EURUSD") == 4
+    assert tracker.take("QUOTES:EURUSD") == 0
+    assert tracker.missed == {"QUOTES:EURUSD": 4}
+
+
+def test_forget_drops_a_topic_and_its_sub_topics():
+    tracker = SequenceTracker()
+    for topic in ("TICKS:EURUSD", "TICKS:EURUSDm", "QUOTES:EURUSD"):
+        tracker.check(topic, 10)
+    tracker.observe(b"TICKS:EURUSD #12")
+
+    tracker.forget("TICKS:EURUSD")
+    assert tracker.take("TICKS:EURUSD") == 0
+    # numbers went on while unsubscribed
+    assert tracker.check("TICKS:EURUSD", 30) == 0
+    assert tracker.check("TICKS:EURUSDm", 30) == 19
+
+    tracker.forget()
+    assert tracker.check("QUOTES:EURUSD", 30) == 0
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from pymetatrader import MetaTrader
+from pymetatrader.broker import (
+    PRIORITY_HISTORY,
+    PRIORITY_QUOTES,
+    PRIORITY_TIMEOUTS,
+    REPLY_TIMEOUT,
+)
+from pymetatrader.simulator import MTServerSimulator
+
+MINUTE = 60 * 1000
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 30))
+
+
+async def started(dealer: bool, capacity=1, **simulator_options):
+    received = []
+
+    async def on_subscribe(type, data):
+        received.append((type, data))
+
+    api = MetaTrader(cache_ttls={})
+    await api.start(on_subscribe, dealer=dealer, broker="async", transport="inproc")
+    simulator = MTServerSimulator(seed=0, capacity=capacity, **simulator_options)
+    simulator.start()
+    return api, simulator, received
+
+
+async def stopped(api: MetaTrader, simulator: MTServerSimulator):
+    simulator.stop()
+    await api.stop()
+
+
+@pytest.mark.parametrize("dealer, capacity", [(False, 1), (True, 1), (True, 4)])
+def test_concurrent_requests_get_their_own_replies(dealer, capacity):
+    async def main():
+        api, simulator, _ = await started(dealer, capacity)
+        try:
+            assert abs(await api.get_time() - time.time()) < 5
+
+            # different sizes tell the replies apart
+            now = (time.time() // 60) * MINUTE
+            sizes = [5, 20, 1, 60, 10, 33]
+            results = await asyncio.gather(
+                *[
+                    api.get_bars("EURUSD", "M1", now - size * MINUTE, now)
+                    for size in sizes
+                ]
+            )
+            for size, (bars, _) in zip(sizes, results):
+                assert bars[0][0] == now - size * MINUTE
+                assert bars[-1][0] <= now
+        finally:
+            await stopped(api, simulator)
+
+    run(main())
+
+
+def test_subscriptions_are_published():
+    async def main():
+        api, simulator, received = await started(dealer=True, publish_interval=0.02)
+        try:
+            assert "SEQ" in await api.negotiate("SEQ")
+            await api.subscribe_quotes(["EURUSD"])
+            for _ in range(100):
+                if any(type == "QUOTES" for type, _ in received):
+                    break
+                await asyncio.sleep(0.02)
+            quotes = [data for type, data in received if type == "QUOTES"]
+            assert quotes and quotes[0][0]["symbol"] == "EURUSD"
+            assert api.quote_cache.get("EURUSD") is not None
+            assert api.sequences.missed == dict()
+        finally:
+            await stopped(api, simulator)
+
+    run(main())
+
+
+def test_requests_wait_for_their_priority_lane():
+    async def main():
+        api = MetaTrader(cache_ttls={})
+        api._timeouts = {**PRIORITY_TIMEOUTS, PRIORITY_HISTORY: 120}
+        timeouts = []
+
+        async def request(request, timeout=None, raw=False):
+            timeouts.append((request, timeout))
+            return "OK|1"
+
+        api._client = SimpleNamespace(request=request)
+        api.account = 1000
+        await api.get_time()
+        await api._request("BARS", "EURUSD;M1;0;60")
+
+        assert timeouts == [
+            (b"@1000;TIME", PRIORITY_TIMEOUTS[PRIORITY_QUOTES] + REPLY_TIMEOUT),
+            (b"@1000;BARS;EURUSD;M1;0;60", 120 + REPLY_TIMEOUT),
+        ]
+
+    run(main())
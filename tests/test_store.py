@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+import numpy as np
+
+from pymetatrader import MetaTrader
+from pymetatrader.bars import BAR_DTYPE
+from pymetatrader.store import BarStore
+
+MINUTE = 60 * 1000
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def make_bars(start, end, step=MINUTE) -> np.ndarray:
+    times = np.arange(start, end + 1, step, dtype=np.float64)
+    bars = np.zeros(len(times), dtype=BAR_DTYPE)
+    bars["time"] = times
+    bars["close"] = times / MINUTE
+    return bars
+
+
+def test_store_appends_and_merges_sorted_bars(tmp_path):
+    store = BarStore(str(tmp_path))
+    store.write("EURUSD", "M1", make_bars(10 * MINUTE, 19 * MINUTE))
+    store.write("EURUSD", "M1", make_bars(20 * MINUTE, 29 * MINUTE))
+    store.write("EURUSD", "M1", make_bars(0, 14 * MINUTE))
+
+    bars = store.read("EURUSD", "M1")
+    assert bars["time"].tolist() == [t * MINUTE for t in range(30)]
+    closes = store.read("EURUSD", "M1", 5 * MINUTE, 7 * MINUTE)["close"]
+    assert closes.tolist() == [5, 6, 7]
+
+
+def test_store_tracks_requested_ranges(tmp_path):
+    store = BarStore(str(tmp_path))
+    assert store.missing("EURUSD", "M1", 0, 99 * MINUTE) == [(0, 99 * MINUTE)]
+
+    # the range beyond the last bar is not complete yet
+    store.write(
+        "EURUSD", "M1", make_bars(10 * MINUTE, 19 * MINUTE), 10 * MINUTE, 25 * MINUTE
+    )
+    assert store.ranges("EURUSD", "M1") == [[10 * MINUTE, 19 * MINUTE]]
+
+    store.write(
+        "EURUSD", "M1", make_bars(60 * MINUTE, 69 * MINUTE), 60 * MINUTE, 69 * MINUTE
+    )
+    assert store.missing("EURUSD", "M1", 0, 99 * MINUTE) == [
+        (0, 10 * MINUTE - 1000),
+        (19 * MINUTE + 1000, 60 * MINUTE - 1000),
+        (69 * MINUTE + 1000, 99 * MINUTE),
+    ]
+    # clamped to the requested range
+    assert store.missing("EURUSD", "M1", 30 * MINUTE, 40 * MINUTE) == [
+        (30 * MINUTE, 40 * MINUTE)
+    ]
+    assert store.missing("EURUSD", "M1", 12 * MINUTE, 15 * MINUTE) == []
+
+    # a range without bars before the last stored one is complete
+    store.write(
+        "EURUSD", "M1", make_bars(0, -1), 19 * MINUTE + 1000, 60 * MINUTE - 1000
+    )
+    assert store.ranges("EURUSD", "M1") == [[10 * MINUTE, 69 * MINUTE]]
+    assert store.coverage("EURUSD", "M1") == (10 * MINUTE, 69 * MINUTE)
+
+
+def test_store_reads_ranges_of_older_stores(tmp_path):
+    store = BarStore(str(tmp_path))
+    store.write("EURUSD", "M1", make_bars(10 * MINUTE, 19 * MINUTE))
+    with open(tmp_path / "EURUSD" / "M1.json", "w") as f:
+        json.dump(dict(start=5 * MINUTE), f)
+    assert store.ranges("EURUSD", "M1") == [[5 * MINUTE, 19 * MINUTE]]
+
+
+def test_get_bars_fetches_only_the_missing_parts(tmp_path):
+    async def main():
+        api = MetaTrader(bar_store=BarStore(str(tmp_path)))
+        requests = []
+
+        async def fetch_bars(symbol, timeframe, start, end, as_array=False):
+            requests.append((start, end))
+            # the terminal has bars up to minute 999, the last one building
+            first = -(-start // MINUTE) * MINUTE
+            bars = make_bars(first, min(end, 999 * MINUTE))
+            return bars, end >= 999 * MINUTE
+
+        api._fetch_bars = fetch_bars
+        bars, building = await api.get_bars(
+            "EURUSD", "M1", 100 * MINUTE, 199 * MINUTE, as_array=True
+        )
+        assert len(bars) == 100 and not building
+
+        # far from the stored range: nothing in between is fetched
+        await api.get_bars("EURUSD", "M1", 500 * MINUTE, 599 * MINUTE)
+        assert requests[-1] == (500 * MINUTE, 599 * MINUTE)
+
+        bars, building = await api.get_bars(
+            "EURUSD", "M1", 150 * MINUTE, 550 * MINUTE, as_array=True
+        )
+        assert requests[-1] == (199 * MINUTE + 1000, 500 * MINUTE - 1000)
+        assert bars["time"].tolist() == [t * MINUTE for t in range(150, 551)]
+
+        # the building bar is returned, never stored
+        bars, building = await api.get_bars(
+            "EURUSD", "M1", 990 * MINUTE, 1010 * MINUTE, as_array=True
+        )
+        assert building and bars["time"][-1] == 999 * MINUTE
+        assert api._bar_store.coverage("EURUSD", "M1")[1] == 998 * MINUTE
+
+        fetched = len(requests)
+        await api.get_bars("EURUSD", "M1", 100 * MINUTE, 599 * MINUTE)
+        assert len(requests) == fetched
+
+    run(main())